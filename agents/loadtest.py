@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Load / soak test for a generated tool server.
+
+Renders a tool with render_project_files(), runs it under node against a stub
+OpenRouter with configurable latency, and drives an open-loop mix of `/`,
+`/api/credits` and `/api/use` at a target RPS. A side thread reads data.sqlite the
+way the analytics collector does, to surface SQLite lock contention. Results go to
+reports/loadtest/<ts>-<server.js hash>.json so template versions can be compared.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List
+
+import requests
+
+from revenue_system import REPORTS_DIR, ROOT, fallback_ideas, local_tool_stats, now_iso, render_project_files, today_str
+
+RESULTS_DIR = REPORTS_DIR / 'loadtest'
+ADMIN_TOKEN = 'loadtest'
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_stub_openrouter(latency_ms: int) -> ThreadingHTTPServer:
+    class Stub(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            time.sleep(latency_ms / 1000)
+            body = json.dumps({'choices': [{'message': {'content': '1) Result:\n- stub output'}}]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    srv = ThreadingHTTPServer(('127.0.0.1', free_port()), Stub)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+def start_tool(workdir: Path, idea: Dict[str, Any], node_modules: Path, stub_port: int):
+    for rel, data in render_project_files('loadtest-tool', idea).items():
+        (workdir / rel).parent.mkdir(parents=True, exist_ok=True)
+        (workdir / rel).write_bytes(data)
+    (workdir / 'node_modules').symlink_to(node_modules)
+    port = free_port()
+    env = {**os.environ, 'PORT': str(port), 'DATA_DIR': str(workdir), 'ADMIN_TOKEN': ADMIN_TOKEN,
+           'OPENROUTER_API_KEY': 'stub', 'OPENROUTER_BASE_URL': f'http://127.0.0.1:{stub_port}'}
+    # stderr to a file, not a pipe: the tool logs every failed request and nothing drains a pipe mid-run
+    with (workdir / 'server.log').open('wb') as log:
+        proc = subprocess.Popen(['node', 'server.js'], cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            if requests.get(f'{base}/health', timeout=1).ok:
+                return proc, base
+        except Exception:
+            pass
+        if proc.poll() is not None:
+            raise RuntimeError(f"tool server exited: {(workdir / 'server.log').read_text(errors='replace')[-500:]}")
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('tool server did not become healthy')
+
+
+def pct(xs: List[float], q: float):
+    return round(xs[min(len(xs) - 1, int(q * len(xs)))], 2) if xs else None
+
+
+def summarize(samples: List[tuple], duration: float) -> Dict[str, Any]:
+    out = {}
+    for ep in sorted({s[0] for s in samples}) + ['all']:
+        rows = [s for s in samples if ep in ('all', s[0])]
+        lat = sorted(s[2] for s in rows)
+        codes = {}
+        for s in rows:
+            codes[str(s[1])] = codes.get(str(s[1]), 0) + 1
+        out[ep] = {'requests': len(rows), 'rps': round(len(rows) / duration, 1), 'p50_ms': pct(lat, .5), 'p95_ms': pct(lat, .95), 'p99_ms': pct(lat, .99), 'status': codes}
+    return out
+
+
+def run(rps: float, duration: float, latency_ms: int, users: int, paid_share: float, concurrency: int, node_modules: Path, mix: Dict[str, float]) -> Dict[str, Any]:
+    idea = fallback_ideas()[0]
+    stub = start_stub_openrouter(latency_ms)
+    workdir = Path(tempfile.mkdtemp(prefix='asf-loadtest-'))
+    proc, base = start_tool(workdir, idea, node_modules, stub.server_address[1])
+    local = threading.local()
+    samples: List[tuple] = []
+    lock = threading.Lock()
+    fields = {f: 'x' * 200 for f in ['cv_text', 'job_title', 'job_description']}
+    uids = [f'lt_{i}' for i in range(users)]
+
+    def session():
+        if not hasattr(local, 's'):
+            local.s = requests.Session()
+        return local.s
+
+    try:
+        # part of the user base gets paid credits so both credit paths are exercised
+        for u in uids[:int(users * paid_share)]:
+            session().post(f'{base}/api/unlock/local', json={'user_id': u, 'credits': 1000000, 'note': 'loadtest'}, headers={'Authorization': f'Bearer {ADMIN_TOKEN}'})
+
+        def hit(ep: str, t0: float):
+            # latency counts from the scheduled send time, so client-side queueing is not hidden
+            u = random.choice(uids)
+            try:
+                if ep == '/api/use':
+                    r = session().post(f'{base}/api/use', json={'user_id': u, **fields}, timeout=30)
+                elif ep == '/api/credits':
+                    r = session().get(f'{base}/api/credits', params={'user': u}, timeout=30)
+                else:
+                    r = session().get(f'{base}/', params={'user': u}, timeout=30)
+                code = r.status_code
+                # the tool's error handler returns the SQLite error code as `error`
+                busy = code >= 500 and any(x in r.text for x in ('SQLITE_BUSY', 'SQLITE_LOCKED', 'database is locked'))
+            except requests.Timeout:
+                code, busy = 'timeout', False
+            except requests.ConnectionError:
+                code, busy = 'conn_error' if proc.poll() is None else 'server_exited', False
+            except Exception:
+                code, busy = 'error', False
+            with lock:
+                samples.append((ep, code, (time.perf_counter() - t0) * 1000, busy))
+
+        reader = {'reads': 0, 'locked': 0, 'lat': []}
+        stop = threading.Event()
+
+        def collector():
+            # same read path as analytics' direct collector, concurrently with the writes
+            db = str(workdir / 'data.sqlite')
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                try:
+                    local_tool_stats(db, today_str())
+                    reader['reads'] += 1
+                    reader['lat'].append((time.perf_counter() - t0) * 1000)
+                except sqlite3.OperationalError:
+                    reader['locked'] += 1
+                stop.wait(0.25)
+
+        ct = threading.Thread(target=collector, daemon=True)
+        ct.start()
+        eps, weights = list(mix), list(mix.values())
+        t_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            n = 0
+            while (elapsed := time.perf_counter() - t_start) < duration:
+                # open loop: schedule by wall clock so a slow server cannot throttle the offered load
+                due = int(elapsed * rps)
+                for i in range(n, due):
+                    ex.submit(hit, random.choices(eps, weights)[0], t_start + i / rps)
+                n = max(n, due)
+                time.sleep(min(0.005, 1 / rps))
+        wall = time.perf_counter() - t_start
+        stop.set(); ct.join()
+        exit_code = proc.poll()
+        server_err = (workdir / 'server.log').read_text(errors='replace')[-2000:] if exit_code is not None else ''
+    finally:
+        proc.terminate(); proc.wait(10)
+        stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    rl = sorted(reader['lat'])
+    return {
+        'target_rps': rps, 'duration_s': round(wall, 1), 'openrouter_latency_ms': latency_ms, 'users': users, 'paid_share': paid_share, 'mix': mix,
+        'endpoints': summarize(samples, wall),
+        'sqlite': {'busy_errors': sum(1 for s in samples if s[3]), 'collector_reads': reader['reads'], 'collector_locked': reader['locked'], 'collector_p95_ms': pct(rl, .95)},
+        'failures': {k: sum(1 for s in samples if s[1] == k) for k in ('timeout', 'conn_error', 'server_exited', 'error')},
+        'server': {'exited': exit_code is not None, 'exit_code': exit_code, 'stderr_tail': server_err},
+    }
+
+
+def save(result: Dict[str, Any]) -> Path:
+    h = hashlib.sha256(render_project_files('loadtest-tool', fallback_ideas()[0])['server.js']).hexdigest()[:10]
+    result.update({'ts': now_iso(), 'server_js_sha': h})
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = RESULTS_DIR / f"{result['ts'][:19].replace(':', '')}-{h}.json"
+    out.write_text(json.dumps(result, indent=2))
+    return out
+
+
+def compare() -> List[Dict[str, Any]]:
+    rows = []
+    for f in sorted(RESULTS_DIR.glob('*.json')):
+        d = json.loads(f.read_text())
+        a = d['endpoints'].get('all', {})
+        rows.append({'file': f.name, 'template': d.get('server_js_sha'), 'target_rps': d['target_rps'], 'rps': a.get('rps'), 'p50_ms': a.get('p50_ms'), 'p95_ms': a.get('p95_ms'), 'p99_ms': a.get('p99_ms'), 'sqlite_busy': d['sqlite']['busy_errors']})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    r = sub.add_parser('run')
+    r.add_argument('--rps', type=float, default=50)
+    r.add_argument('--duration', type=float, default=30, help='seconds; use e.g. 3600 for a soak run')
+    r.add_argument('--openrouter-latency-ms', type=int, default=800)
+    r.add_argument('--users', type=int, default=500)
+    r.add_argument('--paid-share', type=float, default=0.3)
+    r.add_argument('--concurrency', type=int, default=128)
+    r.add_argument('--mix', default='/=0.3,/api/credits=0.3,/api/use=0.4')
+    r.add_argument('--node-modules', default=str(ROOT / 'templates' / 'micro-saas-template' / 'node_modules'))
+    sub.add_parser('compare')
+    args = parser.parse_args()
+    if args.cmd == 'run':
+        mix = {k: float(v) for k, v in (x.split('=') for x in args.mix.split(','))}
+        result = run(args.rps, args.duration, args.openrouter_latency_ms, args.users, args.paid_share, args.concurrency, Path(args.node_modules), mix)
+        out = save(result)
+        print(json.dumps(result, indent=2))
+        print(f'saved {out}')
+    else:
+        print(json.dumps(compare(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
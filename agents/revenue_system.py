@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 import argparse
 import datetime as dt
+import fcntl
+import gzip
+import hashlib
 import json
 import os
 import re
+import shutil
 import sqlite3
 import subprocess
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 
 import requests
 
@@ -97,15 +107,161 @@ def write_json(p: Path, data):
     p.write_text(json.dumps(data, ensure_ascii=False, indent=2))
 
 
+# Idea scoring: linear model over the same five signals; the heuristic is the default
+
+SCORE_COMPONENTS = ['instant_payoff', 'willingness_1usd', 'build_simplicity', 'viral_shareability', 'syria_fit']
+INSTANT_MARKERS = ['instant', '< 30', 'seconds', '30 seconds', 'one click']
+HEURISTIC_MODEL = {'name': 'heuristic', 'base': [18, 14, 8, 8, 4], 'weights': [12, 11, 12, 7, 6]}
+SCORING_MODEL_FILE = RESEARCH_DIR / 'scoring-model.json'
+MIN_TRAINING_PROJECTS = 8
+
+
+def idea_text(v) -> str:
+    if isinstance(v, dict): return ' '.join(idea_text(x) for x in v.values())
+    if isinstance(v, list): return ' '.join(idea_text(x) for x in v)
+    return str(v)
+
+
+def idea_features(idea: Dict[str, Any]) -> List[int]:
+    text = idea_text(idea).lower()
+    return [
+        int(any(x in text for x in INSTANT_MARKERS)),
+        int('instant payoff' in text),
+        int(str(idea.get('build_complexity', '')).upper() == 'LOW'),
+        int(len(idea.get('keywords', [])) >= 5),
+        int(any(ch in idea.get('marketing_channels', []) for ch in ['Syria FB groups', 'Telegram'])),
+    ]
+
+
+def score_ideas(ideas: List[Dict[str, Any]], model: Dict[str, Any] = None) -> List[Dict[str, int]]:
+    model = model or HEURISTIC_MODEL
+    base, weights = model['base'], model['weights']
+    out = []
+    for f in map(idea_features, ideas):
+        parts = [int(round(b + w * x)) for b, w, x in zip(base, weights, f)]
+        out.append({**dict(zip(SCORE_COMPONENTS, parts)), 'total': sum(parts)})
+    return out
+
+
 def score_idea(idea: Dict[str, Any]) -> Dict[str, int]:
-    text = json.dumps(idea, ensure_ascii=False).lower()
-    instant = 30 if any(x in text for x in ['instant', '< 30', 'seconds', '30 seconds', 'one click']) else 18
-    willingness = 25 if 'instant payoff' in text else 14
-    simplicity = 20 if str(idea.get('build_complexity', '')).upper() == 'LOW' else 8
-    viral = 15 if len(idea.get('keywords', [])) >= 5 else 8
-    syria = 10 if any(ch in idea.get('marketing_channels', []) for ch in ['Syria FB groups', 'Telegram']) else 4
-    total = instant + willingness + simplicity + viral + syria
-    return {'instant_payoff': instant, 'willingness_1usd': willingness, 'build_simplicity': simplicity, 'viral_shareability': viral, 'syria_fit': syria, 'total': total}
+    return score_ideas([idea])[0]
+
+
+def solve_linear(a: List[List[float]], b: List[float]) -> List[float]:
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for c in range(n):
+        piv = max(range(c, n), key=lambda r: abs(m[r][c]))
+        m[c], m[piv] = m[piv], m[c]
+        if abs(m[c][c]) < 1e-12:
+            continue
+        for r in range(n):
+            if r != c:
+                k = m[r][c] / m[c][c]
+                m[r] = [x - k * y for x, y in zip(m[r], m[c])]
+    return [m[i][n] / m[i][i] if abs(m[i][i]) >= 1e-12 else 0.0 for i in range(n)]
+
+
+def fit_scoring_model(ridge: float = 1.0):
+    """Fit feature weights to per-project conversion (purchases/uses) across all metrics reports."""
+    uses, buys = {}, {}
+    for f in sorted(REPORTS_DIR.glob('metrics-*.json')):
+        for p in read_json(f, {}).get('projects', []):
+            pid = p.get('project_id')
+            uses[pid] = uses.get(pid, 0) + int(p.get('uses_today') or 0)
+            buys[pid] = buys.get(pid, 0) + int(p.get('purchases_today') or 0)
+    xs, ys = [], []
+    for pid, u in uses.items():
+        idea = read_json(PROJECTS_DIR / str(pid) / 'state' / 'spec.json', {}).get('idea')
+        if idea and u:
+            xs.append(idea_features(idea) + [1]); ys.append(buys[pid] / u)
+    if len(xs) < MIN_TRAINING_PROJECTS:
+        return None
+    # ridge least squares, intercept (last column) unpenalized
+    k = len(xs[0])
+    a = [[sum(x[i] * x[j] for x in xs) + (ridge if i == j and i < k - 1 else 0) for j in range(k)] for i in range(k)]
+    coef = [max(0.0, c) for c in solve_linear(a, [sum(x[i] * y for x, y in zip(xs, ys)) for i in range(k)])[:-1]]
+    if not sum(coef):
+        return None
+    # keep the heuristic's 0-100 scale so the queue's min_score stays meaningful
+    span = sum(HEURISTIC_MODEL['weights'])
+    model = {'name': 'learned', 'base': HEURISTIC_MODEL['base'], 'weights': [round(span * c / sum(coef), 2) for c in coef], 'trained_on': len(xs), 'fitted_at': now_iso()}
+    write_json(SCORING_MODEL_FILE, model)
+    return model
+
+
+def load_scoring_model(env: Dict[str, str]) -> Dict[str, Any]:
+    if env.get('IDEA_SCORING_MODEL', 'heuristic') == 'learned':
+        model = read_json(SCORING_MODEL_FILE, None)
+        if model and len(model.get('weights') or []) == len(SCORE_COMPONENTS):
+            return model
+    return HEURISTIC_MODEL
+
+
+# Idea dedup index (MinHash + LSH over tool name, promise and keywords)
+
+DEDUP_THRESHOLD = 0.7
+MINHASH_PERMS, LSH_BANDS = 64, 16
+STOPWORDS = {'a', 'an', 'and', 'the', 'for', 'to', 'of', 'in', 'on', 'with', 'your', 'you', 'from', 'into', 'under', 'now', 'get'}
+
+
+def idea_tokens(idea: Dict[str, Any]) -> List[str]:
+    text = ' '.join([str(idea.get('tool_name') or ''), str(idea.get('one_sentence_promise') or '')] + [str(k) for k in idea.get('keywords') or []])
+    return sorted({t for t in re.findall(r'[^\W_]+', text.lower()) if len(t) > 1 and t not in STOPWORDS})
+
+
+def minhash(tokens: List[str]) -> List[int]:
+    hashed = [zlib.crc32(t.encode()) for t in tokens] or [0]
+    # (a*x + b) mod p over one crc32 per token instead of one hash per (perm, token)
+    return [min(((2 * i + 1) * 0x9E3779B1 * h + i * 0x7F4A7C15) % 4294967311 for h in hashed) for i in range(MINHASH_PERMS)]
+
+
+def lsh_keys(sig: List[int]) -> List[str]:
+    rows = MINHASH_PERMS // LSH_BANDS
+    return [f"{b}:{zlib.crc32(','.join(map(str, sig[b * rows:(b + 1) * rows])).encode())}" for b in range(LSH_BANDS)]
+
+
+def index_add(index: Dict[str, Any], project_id: str, idea: Dict[str, Any]):
+    tokens = idea_tokens(idea)
+    if not tokens:
+        return
+    n = len(index['entries'])
+    index['entries'].append({'project_id': project_id, 'tokens': tokens})
+    for k in lsh_keys(minhash(tokens)):
+        index['buckets'].setdefault(k, []).append(n)
+
+
+def find_duplicate(index: Dict[str, Any], idea: Dict[str, Any], threshold: float = DEDUP_THRESHOLD):
+    tokens = set(idea_tokens(idea))
+    if not tokens:
+        return None
+    cands = {n for k in lsh_keys(minhash(sorted(tokens))) for n in index['buckets'].get(k, [])}
+    best, best_j = None, 0.0
+    for n in cands:
+        e = index['entries'][n]
+        other = set(e['tokens'])
+        j = len(tokens & other) / len(tokens | other)
+        if j >= threshold and j > best_j:
+            best, best_j = e, j
+    return {'project_id': best['project_id'], 'similarity': round(best_j, 3)} if best else None
+
+
+def load_idea_index(history: bool = True, queue: bool = True, skip: List[Path] = ()) -> Dict[str, Any]:
+    """Index historical idea files, queued items and every built project spec."""
+    index = {'entries': [], 'buckets': {}}
+    for f in sorted(RESEARCH_DIR.glob('ideas-*.json')) if history else []:
+        if f in skip:
+            continue
+        for it in read_json(f, {}).get('ideas', []):
+            index_add(index, it.get('project_id', ''), it)
+    for it in read_json(QUEUE_FILE, {}).get('items', []) if queue else []:
+        index_add(index, (it.get('idea') or {}).get('project_id', ''), it.get('idea') or {})
+    if PROJECTS_DIR.exists():
+        for p in PROJECTS_DIR.iterdir():
+            spec = read_json(p / 'state' / 'spec.json', {}) if p.is_dir() else {}
+            if spec.get('idea'):
+                index_add(index, p.name, spec['idea'])
+    return index
 
 
 # Agent 1
@@ -193,6 +349,7 @@ def niche_research(env: Dict[str, str]):
         ideas = fallback_ideas() * 2
         ideas = ideas[:10]
 
+    index = load_idea_index(queue=False, skip=[out_file])
     normalized = []
     for idx, it in enumerate(ideas[:10], start=1):
         it = dict(it)
@@ -205,12 +362,20 @@ def niche_research(env: Dict[str, str]):
         it['marketing_channels'] = [c for c in (it.get('marketing_channels') or []) if c in ['Syria FB groups', 'Telegram', 'Reddit', 'LinkedIn']]
         if not it['marketing_channels']:
             it['marketing_channels'] = ['Telegram', 'Syria FB groups']
-        score = score_idea(it)
-        it['score_breakdown'] = score
-        it['score'] = score['total']
         normalized.append(it)
 
-    queued = [i for i in normalized if i.get('score', 0) >= 75]
+    model = load_scoring_model(env)
+    for it, score in zip(normalized, score_ideas(normalized, model)):
+        it['score_breakdown'] = score
+        it['score'] = score['total']
+        it['score_model'] = model['name']
+        dup = find_duplicate(index, it)
+        if dup:
+            it['duplicate_of'] = dup
+        else:
+            index_add(index, it['project_id'], it)
+
+    queued = [i for i in normalized if i.get('score', 0) >= 75 and not i.get('duplicate_of')]
     queue = {'date': day, 'version': 2, 'rules': {'min_score': 75}, 'items': []}
     for q in queued:
         queue['items'].append({'status': 'approved', 'created_at': now_iso(), 'score': q['score'], 'idea': q})
@@ -223,29 +388,41 @@ def niche_research(env: Dict[str, str]):
     for i, t in enumerate(top5, 1):
         msg.append(f"{i}) {t['project_id']} ({t['score']})\n{t.get('one_sentence_promise')}")
     telegram_send(env, '\n\n'.join(msg))
-    log_action('agent1_niche_research', 'run', {'ideas_file': str(out_file), 'generated': len(normalized), 'queued': len(queued)})
+    log_action('agent1_niche_research', 'run', {'ideas_file': str(out_file), 'generated': len(normalized), 'queued': len(queued), 'duplicates': sum(1 for i in normalized if i.get('duplicate_of'))})
 
 
 # Agent 2
 
+@lru_cache(maxsize=None)
+def field_id(name: str) -> str:
+    # not slugify(): its timestamp fallback for non-ASCII names (e.g. Arabic labels) collides and changes per run
+    fid = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')[:40]
+    return fid or f"f_{hashlib.sha256(name.encode()).hexdigest()[:8]}"
+
+
 def render_tool_server_js(project_name: str, input_fields: List[str], output_fields: List[str]) -> str:
     return f'''const express=require('express');const cors=require('cors');const Database=require('better-sqlite3');const path=require('path');require('dotenv').config();
 const app=express();const PORT=Number(process.env.PORT||3000);const ADMIN_TOKEN=process.env.ADMIN_TOKEN||'';const OPENROUTER_API_KEY=process.env.OPENROUTER_API_KEY||'';const OPENROUTER_MODEL=process.env.OPENROUTER_MODEL||'openai/gpt-4o-mini';
 app.use(cors());app.use(express.json({{limit:'1mb'}}));
-const db=new Database(path.join(__dirname,'data.sqlite'));db.exec(`CREATE TABLE IF NOT EXISTS users(user_id TEXT PRIMARY KEY,free_date TEXT,free_used INTEGER DEFAULT 0,paid_credits INTEGER DEFAULT 0,updated_at TEXT);CREATE TABLE IF NOT EXISTS purchases(id INTEGER PRIMARY KEY AUTOINCREMENT,provider TEXT,provider_ref TEXT UNIQUE,status TEXT,created_at TEXT);CREATE TABLE IF NOT EXISTS grants(id INTEGER PRIMARY KEY AUTOINCREMENT,user_id TEXT,credits INTEGER,note TEXT,created_at TEXT);CREATE TABLE IF NOT EXISTS events(id INTEGER PRIMARY KEY AUTOINCREMENT,type TEXT,user_id TEXT,meta_json TEXT,created_at TEXT);`);
+const db=new Database(path.join(process.env.DATA_DIR||__dirname,'data.sqlite'));db.pragma('journal_mode = WAL');db.exec(`CREATE TABLE IF NOT EXISTS users(user_id TEXT PRIMARY KEY,free_date TEXT,free_used INTEGER DEFAULT 0,paid_credits INTEGER DEFAULT 0,updated_at TEXT);CREATE TABLE IF NOT EXISTS purchases(id INTEGER PRIMARY KEY AUTOINCREMENT,provider TEXT,provider_ref TEXT UNIQUE,status TEXT,created_at TEXT);CREATE TABLE IF NOT EXISTS grants(id INTEGER PRIMARY KEY AUTOINCREMENT,user_id TEXT,credits INTEGER,note TEXT,created_at TEXT);CREATE TABLE IF NOT EXISTS events(id INTEGER PRIMARY KEY AUTOINCREMENT,type TEXT,user_id TEXT,meta_json TEXT,created_at TEXT);CREATE INDEX IF NOT EXISTS events_created ON events(created_at);CREATE INDEX IF NOT EXISTS events_type_created ON events(type,created_at);CREATE INDEX IF NOT EXISTS purchases_created ON purchases(created_at);CREATE INDEX IF NOT EXISTS grants_created ON grants(created_at);CREATE TABLE IF NOT EXISTS grant_keys(key TEXT PRIMARY KEY,user_id TEXT,credits INTEGER,created_at TEXT);`);
 const gu=db.prepare('SELECT * FROM users WHERE user_id=?');const uu=db.prepare(`INSERT INTO users(user_id,free_date,free_used,paid_credits,updated_at) VALUES(@user_id,@free_date,@free_used,@paid_credits,@updated_at) ON CONFLICT(user_id) DO UPDATE SET free_date=excluded.free_date,free_used=excluded.free_used,paid_credits=excluded.paid_credits,updated_at=excluded.updated_at`);
 const n=()=>new Date().toISOString();const d=()=>new Date().toISOString().slice(0,10);const norm=(x)=>String(x||'').trim();const evt=(t,u,m)=>db.prepare('INSERT INTO events(type,user_id,meta_json,created_at) VALUES(?,?,?,?)').run(t,norm(u)||null,JSON.stringify(m||{{}}),n());
 function ensure(u){{u=norm(u);if(!u)return null;let r=gu.get(u);if(!r){{r={{user_id:u,free_date:d(),free_used:0,paid_credits:0,updated_at:n()}};uu.run(r);}}if(r.free_date!==d()){{r.free_date=d();r.free_used=0;r.updated_at=n();uu.run(r);}}return r;}}
 function credits(r){{const freeLeft=Math.max(0,3-(r.free_used||0));const paid=Math.max(0,r.paid_credits||0);return {{freeLeft,paid,total:freeLeft+paid}};}}
 app.get('/health',(_q,s)=>s.json({{ok:true,service:'{project_name}'}}));
-app.get('/',(q,s)=>{{evt('page_view',q.query?.user||null,{{}});s.sendFile(path.join(__dirname,'public','index.html'));}});app.use(express.static(path.join(__dirname,'public')));
+app.get('/',(q,s)=>{{evt('page_view',q.query?.user||null,{{}});s.sendFile(path.join(__dirname,'public','index.html'));}});app.use('/assets',express.static(path.join(__dirname,'public','assets'),{{maxAge:'1y',immutable:true}}));app.use(express.static(path.join(__dirname,'public')));
 app.get('/api/credits',(q,s)=>{{const u=norm(q.query.user);if(!u)return s.status(400).json({{error:'user is required'}});const r=ensure(u);s.json({{user_id:u,...credits(r),freeDailyLimit:3,paidPackCredits:100}});}});
-app.post('/api/use',async(q,s)=>{{const u=norm(q.body?.user_id);if(!u)return s.status(400).json({{error:'user_id is required'}});const payload={{ {', '.join([f"'{f}': String(q.body?.{slugify(f).replace('-','_')}||'')" for f in input_fields])} }};const r=ensure(u);let mode='';if((r.free_used||0)<3){{r.free_used+=1;mode='free';}}else if((r.paid_credits||0)>0){{r.paid_credits-=1;mode='paid';}}else return s.status(402).json({{error:'insufficient_credits',message:'Top up required'}});r.updated_at=n();uu.run(r);
+const wrap=(h)=>(q,s,nx)=>Promise.resolve(h(q,s)).catch(nx);
+app.post('/api/use',wrap(async(q,s)=>{{const u=norm(q.body?.user_id);if(!u)return s.status(400).json({{error:'user_id is required'}});const payload={{ {', '.join([f"'{f}': String(q.body?.{field_id(f)}||'')" for f in input_fields])} }};const r=ensure(u);let mode='';if((r.free_used||0)<3){{r.free_used+=1;mode='free';}}else if((r.paid_credits||0)>0){{r.paid_credits-=1;mode='paid';}}else return s.status(402).json({{error:'insufficient_credits',message:'Top up required'}});r.updated_at=n();uu.run(r);
 let result='';const sections={json.dumps(output_fields)};if(OPENROUTER_API_KEY){{try{{const prompt=`You are a micro-tool engine. Input JSON: ${{JSON.stringify(payload)}}. Return plain text with sections exactly: ${{sections.join(', ')}}`;const rr=await fetch((process.env.OPENROUTER_BASE_URL||'https://openrouter.ai/api/v1')+'/chat/completions',{{method:'POST',headers:{{Authorization:`Bearer ${{OPENROUTER_API_KEY}}`,'Content-Type':'application/json'}},body:JSON.stringify({{model:OPENROUTER_MODEL,messages:[{{role:'system',content:'Fast practical output.'}},{{role:'user',content:prompt}}],temperature:.2}})}});const jd=await rr.json();result=jd?.choices?.[0]?.message?.content||'';}}catch{{}}}}
-if(!result){{result=sections.map((x,i)=>`${{i+1}}) ${{x}}:\n- Quick output based on your input`).join('\n\n');}}
-evt('use',u,{{mode}});s.json({{ok:true,used:mode,credits:credits(r),result}});}});
-app.post('/api/unlock/local',(q,s)=>{{const a=q.headers['authorization']||'';const tok=a.startsWith('Bearer ')?a.slice(7):String(q.body?.admin_token||'');if(!ADMIN_TOKEN||tok!==ADMIN_TOKEN)return s.status(401).json({{error:'unauthorized'}});const u=norm(q.body?.user_id);const c=Math.max(0,Number(q.body?.credits||100));const note=String(q.body?.note||'').slice(0,500);if(!u)return s.status(400).json({{error:'user_id is required'}});const r=ensure(u);r.paid_credits+=c;r.updated_at=n();uu.run(r);db.prepare('INSERT INTO grants(user_id,credits,note,created_at) VALUES(?,?,?,?)').run(u,c,note,n());evt('local_grant',u,{{credits:c,note}});s.json({{ok:true,user_id:u,credited:c,credits:credits(r)}});}});
-app.get('/admin/stats',(q,s)=>{{if(!ADMIN_TOKEN||String(q.query.token||'')!==ADMIN_TOKEN)return s.status(401).json({{error:'unauthorized'}});const dau=db.prepare("SELECT COUNT(DISTINCT user_id) n FROM events WHERE date(created_at)=date('now') AND user_id IS NOT NULL AND user_id<>''").get().n||0;const uses=db.prepare("SELECT COUNT(*) n FROM events WHERE type='use' AND date(created_at)=date('now')").get().n||0;const pt=db.prepare("SELECT COUNT(*) n FROM purchases WHERE status='credited' AND date(created_at)=date('now')").get().n||0;const gt=db.prepare("SELECT COUNT(*) n FROM grants WHERE date(created_at)=date('now')").get().n||0;s.json({{dau_today:dau,uses_today:uses,purchases:{{total:0,today:pt}},local_grants:{{total:0,today:gt}}}});}});
+if(!result){{result=sections.map((x,i)=>`${{i+1}}) ${{x}}:\\n- Quick output based on your input`).join('\\n\\n');}}
+evt('use',u,{{mode}});s.json({{ok:true,used:mode,credits:credits(r),result}});}}));
+const adm=(q)=>{{const a=q.headers['authorization']||'';const tok=a.startsWith('Bearer ')?a.slice(7):String(q.body?.admin_token||'');return !!ADMIN_TOKEN&&tok===ADMIN_TOKEN;}};const ig=db.prepare('INSERT INTO grants(user_id,credits,note,created_at) VALUES(?,?,?,?)');const ik=db.prepare('INSERT OR IGNORE INTO grant_keys(key,user_id,credits,created_at) VALUES(?,?,?,?)');
+app.post('/api/unlock/local',(q,s)=>{{if(!adm(q))return s.status(401).json({{error:'unauthorized'}});const u=norm(q.body?.user_id);const c=Math.max(0,Number(q.body?.credits||100));const note=String(q.body?.note||'').slice(0,500);if(!u)return s.status(400).json({{error:'user_id is required'}});const r=ensure(u);r.paid_credits+=c;r.updated_at=n();uu.run(r);ig.run(u,c,note,n());evt('local_grant',u,{{credits:c,note}});s.json({{ok:true,user_id:u,credited:c,credits:credits(r)}});}});
+const grantBatch=db.transaction((items)=>items.map((g)=>{{const u=norm(g.user_id);const c=Math.max(0,Number(g.credits||100));const note=String(g.note||'').slice(0,500);const key=String(g.idempotency_key||'').slice(0,200);if(!u)return {{user_id:u,status:'invalid'}};if(key&&!ik.run(key,u,c,n()).changes)return {{user_id:u,status:'duplicate'}};const r=ensure(u);r.paid_credits+=c;r.updated_at=n();uu.run(r);ig.run(u,c,note,n());evt('local_grant',u,{{credits:c,note,batch:true}});return {{user_id:u,status:'granted',credited:c}};}}));
+app.post('/api/unlock/local/batch',(q,s)=>{{if(!adm(q))return s.status(401).json({{error:'unauthorized'}});const items=Array.isArray(q.body?.grants)?q.body.grants:[];if(!items.length||items.length>5000)return s.status(400).json({{error:'grants must be an array of 1-5000 items'}});const note=q.body?.note;const res=grantBatch(items.map((g)=>({{note,...g}})));const cnt=(t)=>res.filter((x)=>x.status===t).length;s.json({{ok:true,granted:cnt('granted'),duplicates:cnt('duplicate'),invalid:cnt('invalid'),results:res}});}});
+app.get('/admin/stats',(q,s)=>{{if(!ADMIN_TOKEN||String(q.query.token||'')!==ADMIN_TOKEN)return s.status(401).json({{error:'unauthorized'}});const rg=[d(),new Date(Date.parse(d())+864e5).toISOString().slice(0,10)];const c=(sql,...a)=>db.prepare(sql).get(...a).n||0;const dau=c("SELECT COUNT(DISTINCT user_id) n FROM events WHERE created_at>=? AND created_at<? AND user_id IS NOT NULL AND user_id<>''",...rg);const uses=c("SELECT COUNT(*) n FROM events WHERE type='use' AND created_at>=? AND created_at<?",...rg);const pt=c("SELECT COUNT(*) n FROM purchases WHERE status='credited' AND created_at>=? AND created_at<?",...rg);const pa=c("SELECT COUNT(*) n FROM purchases WHERE status='credited'");const gt=c("SELECT COUNT(*) n FROM grants WHERE created_at>=? AND created_at<?",...rg);const ga=c("SELECT COUNT(*) n FROM grants");s.json({{dau_today:dau,uses_today:uses,purchases:{{total:pa,today:pt}},local_grants:{{total:ga,today:gt}}}});}});
+app.use((e,_q,s,_nx)=>{{console.error(e);if(s.headersSent)return;s.status(e.status||500).json({{error:e.code||e.type||'internal_error',message:String(e.message||e).slice(0,200)}});}});
 app.listen(PORT,()=>console.log('running',PORT));'''
 
 
@@ -253,18 +430,108 @@ def render_tool_ui_html(idea: Dict[str, Any]) -> str:
     ins = idea.get('input_fields', [])
     promise = idea.get('one_sentence_promise', 'Get instant result.')
     title = idea.get('tool_name', idea.get('project_id'))
-    # map ids
-    fields = []
-    for f in ins:
-        fid = slugify(f).replace('-', '_')
-        fields.append((f, fid))
+    fields = [(f, field_id(f)) for f in ins]
     field_html = '\n'.join([f'<label class="small">{n}</label><textarea id="{fid}" rows="3" placeholder="{n}..."></textarea>' for n, fid in fields])
     payload = ','.join([f"{fid}:document.getElementById('{fid}').value" for _, fid in fields])
     sample = idea.get('sample_input') or {}
-    sample_js = '\n'.join([f"document.getElementById('{slugify(k).replace('-', '_')}') && (document.getElementById('{slugify(k).replace('-', '_')}').value={json.dumps(str(v))});" for k, v in sample.items()])
+    sample_js = '\n'.join([f"document.getElementById('{field_id(k)}') && (document.getElementById('{field_id(k)}').value={json.dumps(str(v))});" for k, v in sample.items()])
     return f'''<!doctype html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width,initial-scale=1"><title>{title}</title><style>body{{font-family:Inter,system-ui;background:#f5f7fb;margin:0}}.w{{max-width:760px;margin:24px auto;padding:0 14px}}.c{{background:#fff;border:1px solid #e2e8f0;border-radius:16px;padding:16px}}textarea{{width:100%;border:1px solid #e2e8f0;border-radius:10px;padding:10px}}.row{{display:flex;gap:8px;flex-wrap:wrap}}button{{padding:10px 14px;border-radius:9px;border:0;background:#2563eb;color:#fff}}button.alt{{background:#fff;color:#0f172a;border:1px solid #e2e8f0}}.out{{margin-top:12px;border:1px solid #e2e8f0;border-radius:12px;padding:12px;white-space:pre-wrap;position:relative}}.blur{{filter:blur(5px)}}.ov{{position:absolute;inset:0;display:flex;align-items:center;justify-content:center;background:rgba(255,255,255,.6);font-weight:700}}.hide{{display:none}}</style></head><body><div class="w"><div class="c"><h2>{title}</h2><p>{promise}</p>{field_html}<div class="row" style="margin-top:10px"><button id="go" onclick="run()">Generate</button><button class="alt" onclick="fillSample()">Sample input</button></div><p>Free uses left today: <b id="freeLeft">-</b> | Paid credits: <b id="paidCredits">-</b></p><div id="out" class="out">Output preview will appear here.<div id="ov" class="ov hide">Unlock full result for $1</div></div></div></div><script>const k='micro_saas_user_id';let uid=localStorage.getItem(k);if(!uid){{uid='u_'+Math.random().toString(36).slice(2,10);localStorage.setItem(k,uid)}}let last='';async function load(){{const r=await fetch('/api/credits?user='+encodeURIComponent(uid));const d=await r.json();freeLeft.textContent=d.freeLeft;paidCredits.textContent=d.paid;return d;}}function fillSample(){{{sample_js}}}async function run(){{const b=document.getElementById('go');b.disabled=true;const payload={{user_id:uid,{payload}}};const r=await fetch('/api/use',{{method:'POST',headers:{{'content-type':'application/json'}},body:JSON.stringify(payload)}});const d=await r.json();if(!r.ok&&d.error==='insufficient_credits'){{out.textContent=(last||'Preview: quick result...').slice(0,280)+'...';out.classList.add('blur');ov.classList.remove('hide');await load();b.disabled=false;return;}}last=d.result||'';out.textContent=last||'Done';out.classList.remove('blur');ov.classList.add('hide');if(d.credits){{freeLeft.textContent=d.credits.freeLeft;paidCredits.textContent=d.credits.paid;}}b.disabled=false;}}load();</script></body></html>'''
 
 
+def minify_css(css: str) -> str:
+    return re.sub(r'\s*([{}:;,>])\s*', r'\1', css).replace(';}', '}').strip()
+
+
+def minify_js(js: str) -> str:
+    # line-level only: keeps newlines so automatic semicolon insertion is never changed
+    return '\n'.join(line.strip() for line in js.splitlines() if line.strip())
+
+
+def build_static_assets(html: str) -> Dict[str, bytes]:
+    """Move inline CSS/JS into minified, content-hashed /assets files with .gz twins (nginx gzip_static)."""
+    files = {}
+
+    def extract(m, ext, minify, tag):
+        body = minify(m.group(1)).encode()
+        name = f'assets/app.{hashlib.sha256(body).hexdigest()[:10]}.{ext}'
+        files[f'public/{name}'] = body
+        files[f'public/{name}.gz'] = gzip.compress(body, 9, mtime=0)
+        return tag.format(src=f'/{name}')
+
+    html = re.sub(r'<style>(.*?)</style>', lambda m: extract(m, 'css', minify_css, '<link rel="stylesheet" href="{src}">'), html, flags=re.S)
+    html = re.sub(r'<script>(.*?)</script>', lambda m: extract(m, 'js', minify_js, '<script src="{src}"></script>'), html, flags=re.S)
+    files['public/index.html'] = re.sub(r'>\s+<', '><', html).encode()
+    return files
+
+
+def render_project_files(project_id: str, idea: Dict[str, Any]) -> Dict[str, bytes]:
+    return {
+        'server.js': render_tool_server_js(project_id, idea.get('input_fields', []), idea.get('output_fields', [])).encode(),
+        **build_static_assets(render_tool_ui_html(idea)),
+    }
+
+
+def deployed_hashes(pdir: Path) -> Dict[str, str]:
+    return {f.relative_to(pdir).as_posix(): hashlib.sha256(f.read_bytes()).hexdigest()
+            for f in [pdir / 'server.js', *sorted((pdir / 'public').rglob('*'))] if f.is_file()}
+
+
+def mark_deployed(project_id: str):
+    """Record what deploy_project.sh just shipped; call only after it exited 0."""
+    pdir = PROJECTS_DIR / project_id
+    write_json(pdir / 'state' / 'deployed.json', deployed_hashes(pdir))
+
+
+def sync_project_files(project_id: str, write: bool = True) -> List[str]:
+    """Re-render a built project from its saved idea; return the files that differ from the deployed version.
+
+    The comparison is against state/deployed.json, not the files on disk, so a failed deploy or a
+    --no-deploy run is picked up again next time instead of looking up to date.
+    """
+    pdir = PROJECTS_DIR / project_id
+    idea = read_json(pdir / 'state' / 'spec.json', {}).get('idea')
+    if not idea:
+        return []
+    deployed = read_json(pdir / 'state' / 'deployed.json', None)
+    if deployed is None:
+        # tool deployed before this was recorded: what is on disk is what it runs
+        deployed = deployed_hashes(pdir)
+        if write:
+            write_json(pdir / 'state' / 'deployed.json', deployed)
+    changed = []
+    files = render_project_files(project_id, idea)
+    for rel, data in files.items():
+        f = pdir / rel
+        h = hashlib.sha256(data).hexdigest()
+        if deployed.get(rel) != h:
+            changed.append(rel)
+        if write and not (f.exists() and hashlib.sha256(f.read_bytes()).hexdigest() == h):
+            # write-then-rename so a file hardlinked from the scaffold store is never modified in place
+            f.parent.mkdir(parents=True, exist_ok=True)
+            tmp = f.with_name(f'.{f.name}.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, f)
+    return changed
+
+
+def prune_stale_assets(project_id: str) -> List[str]:
+    """Drop hashed assets the on-disk index.html no longer references.
+
+    nginx serves /assets from disk while index.html comes from the running image, so the
+    previous generation must survive until deploy_project.sh has shipped the new page.
+    """
+    pdir = PROJECTS_DIR / project_id
+    adir = pdir / 'public' / 'assets'
+    if not adir.exists() or not (pdir / 'public' / 'index.html').exists():
+        return []
+    live = set(re.findall(r'/assets/([\w.-]+)', (pdir / 'public' / 'index.html').read_text()))
+    removed = []
+    for f in adir.iterdir():
+        if f.name not in live and f.name[:-3] not in live:
+            f.unlink(); removed.append(f.name)
+    return removed
+
+
 def build_project_from_idea(env: Dict[str, str], idea: Dict[str, Any]) -> Dict[str, Any]:
     project_id = slugify(idea.get('project_id') or idea.get('tool_name') or 'micro-tool')
     base = project_id
@@ -280,8 +547,7 @@ def build_project_from_idea(env: Dict[str, str], idea: Dict[str, Any]) -> Dict[s
     )
     write_json(pdir / 'state' / 'spec.json', {'stack': 'nextjs', 'idea': idea})
 
-    (pdir / 'server.js').write_text(render_tool_server_js(project_id, idea.get('input_fields', []), idea.get('output_fields', [])))
-    (pdir / 'public' / 'index.html').write_text(render_tool_ui_html(idea))
+    sync_project_files(project_id)
 
     # keep factory /run hook for compatibility
     try:
@@ -289,7 +555,13 @@ def build_project_from_idea(env: Dict[str, str], idea: Dict[str, Any]) -> Dict[s
     except Exception:
         pass
 
-    subprocess.run([str(ROOT / 'scripts' / 'deploy_project.sh'), project_id], check=True)
+    pooled = int(env.get('WARM_POOL_SIZE') or 0) > 0
+    if not (pooled and warm_pool_claim(project_id)):
+        subprocess.run([str(ROOT / 'scripts' / 'deploy_project.sh'), project_id], check=True)
+    mark_deployed(project_id)
+    prune_stale_assets(project_id)
+    if pooled:
+        warm_pool_refill_async()
     reg = read_json(PROJECTS_DIR / 'registry.json', {})
     url = (reg.get(project_id) or {}).get('url', f'https://{project_id}.petsy.company')
     log_action('agent2_product_builder', 'build_deploy', {'project_id': project_id, 'url': url})
@@ -298,11 +570,20 @@ def build_project_from_idea(env: Dict[str, str], idea: Dict[str, Any]) -> Dict[s
 
 def product_builder(env: Dict[str, str]):
     q = read_json(QUEUE_FILE, {'items': []})
-    idx = next((i for i, it in enumerate(q.get('items', [])) if it.get('status') in ('approved', 'new')), None)
-    if idx is None:
-        log_action('agent2_product_builder', 'skip', {'reason': 'queue_empty'})
-        return {'status': 'skip'}
-    idea = q['items'][idx]['idea']
+    index = load_idea_index(history=False, queue=False)
+    while True:
+        idx = next((i for i, it in enumerate(q.get('items', [])) if it.get('status') in ('approved', 'new')), None)
+        if idx is None:
+            write_json(QUEUE_FILE, q)
+            log_action('agent2_product_builder', 'skip', {'reason': 'queue_empty'})
+            return {'status': 'skip'}
+        idea = q['items'][idx]['idea']
+        dup = find_duplicate(index, idea)
+        if not dup:
+            break
+        # near-identical to a built tool: drop it before it costs a docker build
+        q['items'][idx].update({'status': 'duplicate', 'duplicate_of': dup})
+        log_action('agent2_product_builder', 'skip_duplicate', {'project_id': idea.get('project_id'), 'duplicate_of': dup})
     built = build_project_from_idea(env, idea)
     q['items'][idx].update({'status': 'built', 'built_at': now_iso(), 'project_id': built['project_id'], 'url': built['url']})
     write_json(QUEUE_FILE, q)
@@ -311,30 +592,64 @@ def product_builder(env: Dict[str, str]):
     return built
 
 
+def regenerate(env: Dict[str, str], project_ids: List[str] = None, deploy: bool = True, dry_run: bool = False):
+    """Push the current templates to existing tools, redeploying only those whose output changed."""
+    ids = project_ids or sorted(p.name for p in PROJECTS_DIR.iterdir() if (p / 'state' / 'spec.json').exists())
+    with ProcessPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as ex:
+        results = dict(zip(ids, ex.map(sync_project_files, ids, [not dry_run] * len(ids))))
+    changed = {pid: files for pid, files in results.items() if files}
+    failed = []
+    if deploy and not dry_run:
+        for pid in changed:
+            if subprocess.run([str(ROOT / 'scripts' / 'deploy_project.sh'), pid]).returncode != 0:
+                failed.append(pid)
+            else:
+                mark_deployed(pid)
+                prune_stale_assets(pid)
+    result = {'checked': len(ids), 'changed': changed, 'deployed': deploy and not dry_run, 'failed': failed, 'dry_run': dry_run}
+    log_action('agent2_product_builder', 'regenerate', result)
+    if changed and not dry_run:
+        telegram_send(env, f"♻️ Regenerated {len(changed)}/{len(ids)} tools" + (f"\nFailed deploys: {', '.join(failed)}" if failed else ''))
+    return result
+
+
 # Agent 3
 
-def marketing_assets(env: Dict[str, str], project_id: str):
-    pdir = PROJECTS_DIR / project_id
-    mdir = pdir / 'marketing'
-    mdir.mkdir(parents=True, exist_ok=True)
-    spec = (pdir / 'project_spec.md').read_text() if (pdir / 'project_spec.md').exists() else project_id
-    raw = openrouter_chat(
-        env,
-        'Return strict JSON only. Value-first tone, no hard selling.',
-        f"Create marketing for:\n{spec}\nReturn keys: syria_fb_post_1,syria_fb_post_2,reddit_post_feedback,linkedin_post,comment_replies_ar(array5),dm_scripts_ar(array5)",
-    )
-    try:
-        d = json.loads(raw)
-    except Exception:
-        d = {
-            'syria_fb_post_1': f"أداة {project_id} تعطي نتيجة فورية خلال ثواني. شاركوني رأيكم بأفضل استخدام.",
-            'syria_fb_post_2': f"إذا بدك نتيجة سريعة بدون تعقيد، جرّب {project_id} وقلّي شو بتحب نطوّر.",
-            'reddit_post_feedback': f"Built {project_id} to solve one urgent task in under 30s. Looking for product feedback.",
-            'linkedin_post': f"Launched {project_id}: a single-action micro-tool designed for immediate value.",
-            'comment_replies_ar': ["ممتاز، جربها وقلي شو النتيجة."] * 5,
-            'dm_scripts_ar': ["مرحباً! عملنا أداة سريعة لمشكلتك، إذا بتحب ابعتلك الرابط."] * 5,
-        }
+MARKETING_KEYS = 'syria_fb_post_1,syria_fb_post_2,reddit_post_feedback,linkedin_post,comment_replies_ar(array5),dm_scripts_ar(array5)'
+MARKETING_SYSTEM = 'Return strict JSON only. Value-first tone, no hard selling.'
+MARKETING_POSTS = ['syria_fb_post_1', 'syria_fb_post_2', 'reddit_post_feedback', 'linkedin_post']
+MARKETING_LISTS = ['comment_replies_ar', 'dm_scripts_ar']
+MARKETING_OUTPUT_TOKENS = 1200  # rough reply size for one project's six assets
+
+
+def marketing_valid(d) -> bool:
+    """Posts must be non-empty strings and replies/DMs non-empty lists of strings (what write_marketing joins)."""
+    return (isinstance(d, dict)
+            and all(isinstance(d.get(k), str) and d[k].strip() for k in MARKETING_POSTS)
+            and all(isinstance(d.get(k), list) and d[k] and all(isinstance(x, str) for x in d[k]) for k in MARKETING_LISTS))
+
 
+def marketing_spec(project_id: str) -> Tuple[str, str]:
+    p = PROJECTS_DIR / project_id / 'project_spec.md'
+    spec = p.read_text() if p.exists() else project_id
+    # the prompt is part of the hash, so changing what we ask for regenerates everything
+    return spec, hashlib.sha256(f'{MARKETING_SYSTEM}\n{MARKETING_KEYS}\n{spec}'.encode()).hexdigest()
+
+
+def fallback_marketing(project_id: str) -> Dict[str, Any]:
+    return {
+        'syria_fb_post_1': f"أداة {project_id} تعطي نتيجة فورية خلال ثواني. شاركوني رأيكم بأفضل استخدام.",
+        'syria_fb_post_2': f"إذا بدك نتيجة سريعة بدون تعقيد، جرّب {project_id} وقلّي شو بتحب نطوّر.",
+        'reddit_post_feedback': f"Built {project_id} to solve one urgent task in under 30s. Looking for product feedback.",
+        'linkedin_post': f"Launched {project_id}: a single-action micro-tool designed for immediate value.",
+        'comment_replies_ar': ["ممتاز، جربها وقلي شو النتيجة."] * 5,
+        'dm_scripts_ar': ["مرحباً! عملنا أداة سريعة لمشكلتك، إذا بتحب ابعتلك الرابط."] * 5,
+    }
+
+
+def write_marketing(project_id: str, d: Dict[str, Any], spec_hash: str = None) -> Dict[str, str]:
+    mdir = PROJECTS_DIR / project_id / 'marketing'
+    mdir.mkdir(parents=True, exist_ok=True)
     files = {
         'syria_fb_post_1.txt': d.get('syria_fb_post_1', ''),
         'syria_fb_post_2.txt': d.get('syria_fb_post_2', ''),
@@ -346,7 +661,25 @@ def marketing_assets(env: Dict[str, str], project_id: str):
     for fn, c in files.items():
         if isinstance(c, (dict, list)):
             c = json.dumps(c, ensure_ascii=False, indent=2)
-        (mdir / fn).write_text(str(c))
+        files[fn] = str(c)
+        (mdir / fn).write_text(files[fn])
+    if spec_hash:
+        (mdir / '.spec-hash').write_text(spec_hash)
+    return files
+
+
+def marketing_assets(env: Dict[str, str], project_id: str):
+    spec, spec_hash = marketing_spec(project_id)
+    raw = openrouter_chat(env, MARKETING_SYSTEM, f"Create marketing for:\n{spec}\nReturn keys: {MARKETING_KEYS}")
+    try:
+        d = json.loads(raw)
+    except Exception:
+        d = None
+    generated = marketing_valid(d)
+    if not generated:
+        d = fallback_marketing(project_id)
+    # only a real generation pins the hash; fallback copy is retried by the next batch run
+    files = write_marketing(project_id, d, spec_hash if generated else None)
 
     fb_preview = str(files.get('syria_fb_post_1.txt', ''))[:600]
     reddit_preview = str(files.get('reddit_post.txt', ''))[:600]
@@ -354,6 +687,175 @@ def marketing_assets(env: Dict[str, str], project_id: str):
     log_action('agent3_marketing', 'generate', {'project_id': project_id, 'files': list(files.keys())})
 
 
+def token_budget(tokens_per_min: int):
+    """Token bucket shared by worker threads: take(n) blocks until n tokens are available."""
+    lock, state = threading.Lock(), {'tokens': float(tokens_per_min), 'ts': time.monotonic()}
+
+    def take(n: int):
+        n = min(n, tokens_per_min)
+        while True:
+            with lock:
+                t = time.monotonic()
+                state['tokens'] = min(tokens_per_min, state['tokens'] + (t - state['ts']) * tokens_per_min / 60)
+                state['ts'] = t
+                if state['tokens'] >= n:
+                    state['tokens'] -= n
+                    return
+                wait = (n - state['tokens']) * 60 / tokens_per_min
+            time.sleep(wait)
+    return take
+
+
+def marketing_batch(env: Dict[str, str], project_ids: List[str] = None, force: bool = False):
+    """Regenerate marketing for many projects: several specs per prompt, concurrent under a token budget."""
+    ids = project_ids or sorted(p.name for p in PROJECTS_DIR.iterdir() if (p / 'project_spec.md').exists())
+    todo, skipped = [], []
+    for pid in ids:
+        spec, h = marketing_spec(pid)
+        hp = PROJECTS_DIR / pid / 'marketing' / '.spec-hash'
+        if not force and hp.exists() and hp.read_text().strip() == h:
+            skipped.append(pid)
+        else:
+            todo.append((pid, spec, h))
+
+    size = max(1, int(env.get('MARKETING_BATCH_SIZE', '4') or 4))
+    take = token_budget(max(1000, int(env.get('MARKETING_TOKENS_PER_MIN', '60000') or 60000)))
+    batches = [todo[i:i + size] for i in range(0, len(todo), size)]
+
+    def ask(batch) -> Dict[str, Any]:
+        if len(batch) == 1:
+            pid, spec, _ = batch[0]
+            usr = f"Create marketing for:\n{spec}\nReturn keys: {MARKETING_KEYS}"
+        else:
+            usr = ('Create marketing for each project below. Return one JSON object keyed by project_id; each value has keys: '
+                   f"{MARKETING_KEYS}\n\n" + '\n\n'.join(f'### project_id: {pid}\n{spec}' for pid, spec, _ in batch))
+        take(len(usr) // 4 + MARKETING_OUTPUT_TOKENS * len(batch))
+        try:
+            d = json.loads(openrouter_chat(env, MARKETING_SYSTEM, usr))
+        except Exception:
+            d = None
+        if len(batch) == 1:
+            return {batch[0][0]: d} if marketing_valid(d) else {}
+        # valid JSON is not enough: a list, a string or an entry with missing or mistyped keys falls through to a retry
+        d = d if isinstance(d, dict) else {}
+        out = {pid: d[pid] for pid, _, _ in batch if marketing_valid(d.get(pid))}
+        # the model dropped or truncated part of a packed reply: ask for the missing ones alone
+        for item in batch:
+            if item[0] not in out:
+                out.update(ask([item]))
+        return out
+
+    generated, fallback = [], []
+    with ThreadPoolExecutor(max_workers=max(1, int(env.get('MARKETING_CONCURRENCY', '4') or 4))) as ex:
+        for batch, res in zip(batches, ex.map(ask, batches)):
+            for pid, _, h in batch:
+                if pid in res:
+                    write_marketing(pid, res[pid], h); generated.append(pid)
+                else:
+                    write_marketing(pid, fallback_marketing(pid)); fallback.append(pid)
+
+    result = {'checked': len(ids), 'generated': generated, 'fallback': fallback, 'skipped': skipped, 'prompts': len(batches), 'batch_size': size}
+    log_action('agent3_marketing', 'generate_batch', result)
+    if generated or fallback:
+        telegram_send(env, f"📣 Marketing regenerated for {len(generated) + len(fallback)}/{len(ids)} tools ({len(skipped)} unchanged)"
+                      + (f"\nFallback copy: {', '.join(fallback)}" if fallback else ''))
+    return result
+
+
+# Metrics warehouse: one row per project/day plus precomputed 7/28-day rolling windows
+
+WAREHOUSE_DB = REPORTS_DIR / 'metrics.sqlite'
+
+
+def warehouse_connect() -> sqlite3.Connection:
+    con = sqlite3.connect(str(WAREHOUSE_DB))
+    con.row_factory = sqlite3.Row
+    con.executescript("""
+CREATE TABLE IF NOT EXISTS daily(project_id TEXT NOT NULL, day TEXT NOT NULL, dau INTEGER, uses INTEGER, purchases INTEGER, PRIMARY KEY(project_id, day)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS daily_day ON daily(day);
+CREATE TABLE IF NOT EXISTS rolling(day TEXT NOT NULL, project_id TEXT NOT NULL, dau_7 REAL, uses_7 INTEGER, purchases_7 INTEGER, conv_7 REAL, dau_28 REAL, uses_28 INTEGER, purchases_28 INTEGER, conv_28 REAL, PRIMARY KEY(day, project_id)) WITHOUT ROWID;
+""")
+    if not con.execute('SELECT 1 FROM daily LIMIT 1').fetchone():
+        # first run: backfill from the per-day JSON reports
+        for f in sorted(REPORTS_DIR.glob('metrics-*.json')):
+            d = read_json(f, {})
+            if d.get('date'):
+                warehouse_append(con, d['date'], d.get('projects', []))
+    return con
+
+
+def warehouse_append(con: sqlite3.Connection, day: str, rows: List[Dict[str, Any]]):
+    """Upsert one day of metrics rows and refresh that day's rolling windows."""
+    d0 = dt.date.fromisoformat(day)
+    d7, d28 = str(d0 - dt.timedelta(days=7)), str(d0 - dt.timedelta(days=28))
+    with con:
+        con.executemany(
+            'INSERT INTO daily(project_id,day,dau,uses,purchases) VALUES(?,?,?,?,?) ON CONFLICT(project_id,day) DO UPDATE SET dau=excluded.dau,uses=excluded.uses,purchases=excluded.purchases',
+            [(r['project_id'], day, int(r.get('dau_today') or 0), int(r.get('uses_today') or 0), int(r.get('purchases_today') or 0)) for r in rows],
+        )
+        con.execute("""
+INSERT OR REPLACE INTO rolling(day,project_id,dau_7,uses_7,purchases_7,conv_7,dau_28,uses_28,purchases_28,conv_28)
+SELECT :day, project_id,
+  ROUND(1.0 * SUM(CASE WHEN day > :d7 THEN dau ELSE 0 END) / MIN(7, age), 2), SUM(CASE WHEN day > :d7 THEN uses ELSE 0 END), SUM(CASE WHEN day > :d7 THEN purchases ELSE 0 END),
+  IFNULL(ROUND(100.0 * SUM(CASE WHEN day > :d7 THEN purchases ELSE 0 END) / NULLIF(SUM(CASE WHEN day > :d7 THEN uses ELSE 0 END), 0), 2), 0),
+  ROUND(1.0 * SUM(dau) / MIN(28, age), 2), SUM(uses), SUM(purchases), IFNULL(ROUND(100.0 * SUM(purchases) / NULLIF(SUM(uses), 0), 2), 0)
+FROM daily JOIN (
+  -- days since the tool's first metrics row: missing days count as zero, young tools are not diluted
+  SELECT project_id AS pid, CAST(julianday(:day) - julianday(MIN(day)) AS INTEGER) + 1 AS age FROM daily GROUP BY project_id
+) ON pid = project_id
+WHERE day > :d28 AND day <= :day AND project_id IN (SELECT project_id FROM daily WHERE day = :day)
+GROUP BY project_id""", {'day': day, 'd7': d7, 'd28': d28})
+
+
+def warehouse_rolling(con: sqlite3.Connection, day: str) -> Dict[str, Dict[str, Any]]:
+    return {r['project_id']: dict(r) for r in con.execute('SELECT * FROM rolling WHERE day=?', (day,))}
+
+
+def warehouse_trend(con: sqlite3.Connection, project_id: str, days: int = 365) -> List[Dict[str, Any]]:
+    since = str(dt.date.fromisoformat(today_str()) - dt.timedelta(days=days))
+    return [dict(r) for r in con.execute(
+        'SELECT d.day,d.dau,d.uses,d.purchases,r.dau_7,r.conv_7,r.dau_28,r.conv_28 FROM daily d LEFT JOIN rolling r ON r.day=d.day AND r.project_id=d.project_id '
+        'WHERE d.project_id=? AND d.day>? ORDER BY d.day', (project_id, since))]
+
+
+# Direct stats collector: read each local tool's data.sqlite instead of polling /admin/stats
+
+def tool_db_path(project_id: str) -> Path:
+    p = PROJECTS_DIR / project_id
+    return p / 'data' / 'data.sqlite' if (p / 'data' / 'data.sqlite').exists() else p / 'data.sqlite'
+
+
+def local_tool_stats(db_path: str, day: str) -> Dict[str, Any]:
+    """Same shape as the tool's /admin/stats, read over a read-only (WAL-safe) connection."""
+    rg = (day, str(dt.date.fromisoformat(day) + dt.timedelta(days=1)))
+    con = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, timeout=5)
+    try:
+        tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        c = lambda t, sql, *a: int(con.execute(sql, a).fetchone()[0] or 0) if t in tables else 0
+        return {
+            'dau_today': c('events', "SELECT COUNT(DISTINCT user_id) FROM events WHERE created_at>=? AND created_at<? AND user_id IS NOT NULL AND user_id<>''", *rg),
+            'uses_today': c('events', "SELECT COUNT(*) FROM events WHERE type='use' AND created_at>=? AND created_at<?", *rg),
+            'purchases': {'total': c('purchases', "SELECT COUNT(*) FROM purchases WHERE status='credited'"), 'today': c('purchases', "SELECT COUNT(*) FROM purchases WHERE status='credited' AND created_at>=? AND created_at<?", *rg)},
+            'local_grants': {'total': c('grants', 'SELECT COUNT(*) FROM grants'), 'today': c('grants', 'SELECT COUNT(*) FROM grants WHERE created_at>=? AND created_at<?', *rg)},
+        }
+    finally:
+        con.close()
+
+
+def collect_local_stats(project_ids: List[str], day: str) -> Dict[str, Dict[str, Any]]:
+    paths = {pid: tool_db_path(pid) for pid in project_ids}
+    paths = {pid: str(p) for pid, p in paths.items() if p.exists()}
+    out = {}
+    if not paths:
+        return out
+    with ProcessPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as ex:
+        futs = {pid: ex.submit(local_tool_stats, p, day) for pid, p in paths.items()}
+        for pid, f in futs.items():
+            try: out[pid] = f.result()
+            except Exception: pass  # locked/corrupt db: caller falls back to HTTP
+    return out
+
+
 # Agent 4
 
 def analytics(env: Dict[str, str]):
@@ -361,38 +863,55 @@ def analytics(env: Dict[str, str]):
     token = env.get('ADMIN_TOKEN', '')
     rows = []
     total_rev = 0
+    local = collect_local_stats(list(reg.keys()), today_str())
     for pid, meta in reg.items():
         url = (meta or {}).get('url', f'https://{pid}.petsy.company')
-        d = {}
-        try:
-            r = requests.get(f'{url}/admin/stats', params={'token': token}, timeout=20)
-            if r.ok: d = r.json()
-        except Exception:
-            pass
+        d = local.get(pid)
+        source = 'sqlite'
+        if d is None:
+            d, source = {}, 'http'
+            try:
+                r = requests.get(f'{url}/admin/stats', params={'token': token}, timeout=20)
+                if r.ok: d = r.json()
+            except Exception:
+                pass
         uses = int(d.get('uses_today') or 0)
         purchases = int(((d.get('purchases') or {}).get('today') or 0))
         conv = round((purchases / uses * 100), 2) if uses else 0.0
         total_rev += purchases
-        rows.append({'project_id': pid, 'url': url, 'dau_today': int(d.get('dau_today') or 0), 'uses_today': uses, 'purchases_today': purchases, 'conversion_rate': conv})
+        rows.append({'project_id': pid, 'url': url, 'dau_today': int(d.get('dau_today') or 0), 'uses_today': uses, 'purchases_today': purchases, 'conversion_rate': conv, 'source': source})
     rows.sort(key=lambda x: (x['purchases_today'], x['uses_today']), reverse=True)
     out = REPORTS_DIR / f'metrics-{today_str()}.json'
     write_json(out, {'date': today_str(), 'projects': rows, 'estimated_revenue_today_usd': total_rev})
+    con = warehouse_connect()
+    warehouse_append(con, today_str(), rows)
+    con.close()
     top = rows[0]['project_id'] if rows else 'n/a'
     low = [r['project_id'] for r in rows if r['uses_today'] < 10][:5]
     telegram_send(env, f"📊 Metrics\nTop: {top}\nLow: {', '.join(low) if low else 'none'}\nRevenue today est: ${total_rev}")
-    log_action('agent4_analytics', 'run', {'file': str(out), 'projects': len(rows)})
+    model = fit_scoring_model()
+    log_action('agent4_analytics', 'run', {'file': str(out), 'projects': len(rows), 'scoring_model': (model or {}).get('weights')})
 
 
 # Agent 5
 
+# (target_user, extra keywords) for the two variants optimization() queues per winner
+VARIANT_ANGLES = [
+    ('Students and fresh graduates', ['student', 'beginner']),
+    ('Freelancers and small business owners', ['freelancer', 'business']),
+]
+
+
 def optimization(env: Dict[str, str]):
-    metrics = read_json(REPORTS_DIR / f'metrics-{today_str()}.json', {'projects': []})
+    con = warehouse_connect()
+    trends = warehouse_rolling(con, today_str())
+    con.close()
     reg = read_json(PROJECTS_DIR / 'registry.json', {})
     q = read_json(QUEUE_FILE, {'date': today_str(), 'version': 2, 'rules': {'min_score': 75}, 'items': []})
+    index = load_idea_index()
     decisions = []
 
-    for p in metrics.get('projects', []):
-        pid = p['project_id']
+    for pid, p in trends.items():
         updated = (reg.get(pid) or {}).get('updated_at')
         age_hours = 0
         if updated:
@@ -402,28 +921,29 @@ def optimization(env: Dict[str, str]):
                 pass
 
         status = None
-        if age_hours >= 48 and int(p.get('dau_today', 0)) < 5 and int(p.get('purchases_today', 0)) == 0:
+        if age_hours >= 48 and (p['dau_7'] or 0) < 5 and not p['purchases_28']:
             status = 'ARCHIVE_CANDIDATE'
             (PROJECTS_DIR / pid / 'ARCHIVE_CANDIDATE').write_text(now_iso())
-        elif p.get('conversion_rate', 0) > 3:
+        elif (p['conv_7'] or 0) > 3:
             status = 'WINNER'
-            for i in [1, 2]:
-                q['items'].append({
-                    'status': 'approved', 'created_at': now_iso(), 'score': 80,
-                    'idea': {
-                        'project_id': f'{pid}-v{i}', 'tool_name': f'{pid} Variant {i}',
-                        'one_sentence_promise': 'Instant result for a tighter audience',
-                        'target_user': f'Variant audience {i}', 'user_intent': 'Get result now',
-                        'input_fields': ['Input A', 'Input B'], 'output_fields': ['Result', 'Fixes'],
-                        'why_pay_1_dollar': 'instant payoff', 'build_complexity': 'LOW',
-                        'marketing_channels': ['Telegram', 'Syria FB groups'], 'keywords': [pid, 'variant', 'instant', 'microtool', 'fast'],
-                        'sample_input': {'a': 'x'}, 'sample_output_outline': ['result']
-                    },
-                    'source': 'winner_variant'
-                })
+            for i, (audience, angle) in enumerate(VARIANT_ANGLES, start=1):
+                # each variant carries its own audience words, otherwise v2 dedups against v1
+                variant = {
+                    'project_id': f'{pid}-v{i}', 'tool_name': f'{pid} {angle[0]} edition',
+                    'one_sentence_promise': f'Instant result for {audience.lower()}',
+                    'target_user': audience, 'user_intent': 'Get result now',
+                    'input_fields': ['Input A', 'Input B'], 'output_fields': ['Result', 'Fixes'],
+                    'why_pay_1_dollar': 'instant payoff', 'build_complexity': 'LOW',
+                    'marketing_channels': ['Telegram', 'Syria FB groups'], 'keywords': [pid, 'instant', 'microtool', *angle],
+                    'sample_input': {'a': 'x'}, 'sample_output_outline': ['result']
+                }
+                if find_duplicate(index, variant):
+                    continue
+                index_add(index, variant['project_id'], variant)
+                q['items'].append({'status': 'approved', 'created_at': now_iso(), 'score': 80, 'idea': variant, 'source': 'winner_variant'})
 
         if status:
-            decisions.append({'project_id': pid, 'status': status})
+            decisions.append({'project_id': pid, 'status': status, 'dau_7': p['dau_7'], 'conv_7': p['conv_7'], 'purchases_28': p['purchases_28']})
 
     write_json(QUEUE_FILE, q)
     out = REPORTS_DIR / f'optimization-{today_str()}.json'
@@ -440,11 +960,12 @@ def revenue(env: Dict[str, str]):
     total_local = 0
     best, best_p = None, -1
     for pid in reg.keys():
-        dbp = PROJECTS_DIR / pid / 'data.sqlite'
+        dbp = tool_db_path(pid)
         if not dbp.exists():
             continue
         try:
-            con = sqlite3.connect(str(dbp)); cur = con.cursor()
+            # read-only, like local_tool_stats: never take a write lock on a live tool database
+            con = sqlite3.connect(f'file:{dbp}?mode=ro', uri=True, timeout=5); cur = con.cursor()
             p = int(cur.execute("select count(*) from purchases where status='credited'").fetchone()[0]) if cur.execute("select name from sqlite_master where type='table' and name='purchases'").fetchone() else 0
             g = int(cur.execute("select count(*) from grants").fetchone()[0]) if cur.execute("select name from sqlite_master where type='table' and name='grants'").fetchone() else 0
             con.close()
@@ -453,10 +974,219 @@ def revenue(env: Dict[str, str]):
         except Exception:
             pass
     est = total_purchases * 1
+    con = warehouse_connect()
+    trends = warehouse_rolling(con, today_str())
+    con.close()
+    p7 = sum(t['purchases_7'] or 0 for t in trends.values())
+    p28 = sum(t['purchases_28'] or 0 for t in trends.values())
+    hot = max(trends.values(), key=lambda t: (t['purchases_7'] or 0, t['uses_7'] or 0), default={}).get('project_id')
     out = REPORTS_DIR / f'revenue-{today_str()}.md'
-    out.write_text(f"# Revenue Report {today_str()}\n\n- Total purchases: {total_purchases}\n- Total local grants: {total_local}\n- Estimated revenue: ${est}\n- Best selling project: {best or 'n/a'}\n- Recommended focus niche: ATS/CV + Arabic ad copy micro-tools\n")
-    telegram_send(env, f"💰 Revenue today\nEstimated ${est}\nBest seller: {best or 'n/a'}\nFocus: ATS + Arabic copy tools")
-    log_action('agent6_revenue', 'run', {'file': str(out), 'estimated': est, 'best': best})
+    out.write_text(f"# Revenue Report {today_str()}\n\n- Total purchases: {total_purchases}\n- Total local grants: {total_local}\n- Estimated revenue: ${est}\n- Purchases last 7 days: {p7}\n- Purchases last 28 days: {p28}\n- Best selling project: {best or 'n/a'}\n- Best project last 7 days: {hot or 'n/a'}\n- Recommended focus niche: ATS/CV + Arabic ad copy micro-tools\n")
+    telegram_send(env, f"💰 Revenue today\nEstimated ${est}\nLast 7d: {p7} | 28d: {p28}\nBest seller: {best or 'n/a'}\nFocus: ATS + Arabic copy tools")
+    log_action('agent6_revenue', 'run', {'file': str(out), 'estimated': est, 'best': best, 'purchases_7': p7, 'purchases_28': p28})
+
+
+# Hibernation: stop idle tool containers; agents/wake_proxy.py cold-starts them on demand
+
+COLD_START_LOG = REPORTS_DIR / 'cold-starts.jsonl'
+
+
+def parse_ts(ts: str):
+    try: return dt.datetime.fromisoformat(str(ts).replace('Z', '+00:00'))
+    except Exception: return None
+
+
+def update_json_locked(p: Path, fn):
+    """Apply fn to the JSON object in p under an exclusive flock, write it back and return fn's result.
+
+    The lock lives on a sibling <name>.lock file and the JSON is replaced atomically, so lock-free
+    readers (read_json in the wake proxy, hibernation, allocate_port) never see a partial file.
+    """
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p.with_name(f'{p.name}.lock'), 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        txt = p.read_text().strip() if p.exists() else ''
+        data = json.loads(txt) if txt else {}
+        out = fn(data)
+        tmp = p.with_name(f'.{p.name}.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps(data, indent=2))
+        os.replace(tmp, p)
+        return out
+
+
+def update_registry(project_id: str, **fields):
+    """Update one registry entry under the registry lock; a None value removes the key."""
+    def apply(reg):
+        meta = reg.setdefault(project_id, {})
+        for k, v in fields.items():
+            if v is None: meta.pop(k, None)
+            else: meta[k] = v
+    update_json_locked(PROJECTS_DIR / 'registry.json', apply)
+
+
+def tool_last_activity(project_id: str, meta: Dict[str, Any]):
+    stamps = [meta.get('updated_at'), meta.get('woken_at')]
+    dbp = tool_db_path(project_id)
+    if dbp.exists():
+        try:
+            con = sqlite3.connect(f'file:{dbp}?mode=ro', uri=True, timeout=5)
+            stamps.append(con.execute('SELECT MAX(created_at) FROM events').fetchone()[0])
+            con.close()
+        except Exception:
+            pass
+    parsed = [t for t in map(parse_ts, filter(None, stamps)) if t]
+    return max(parsed) if parsed else None
+
+
+def cold_start_stats(days: int = 7) -> Dict[str, Any]:
+    since = dt.datetime.now(dt.timezone.utc) - dt.timedelta(days=days)
+    ms = []
+    if COLD_START_LOG.exists():
+        for line in COLD_START_LOG.read_text().splitlines():
+            try: e = json.loads(line)
+            except Exception: continue
+            if e.get('ok') and (parse_ts(e.get('ts')) or since) > since:
+                ms.append(e['ms'])
+    ms.sort()
+    pct = lambda q: ms[min(len(ms) - 1, int(q * len(ms)))] if ms else None
+    return {'count': len(ms), 'p50_ms': pct(0.5), 'p95_ms': pct(0.95), 'max_ms': ms[-1] if ms else None}
+
+
+def hibernation(env: Dict[str, str]):
+    idle_hours = float(env.get('HIBERNATE_IDLE_HOURS') or 24)
+    reg = read_json(PROJECTS_DIR / 'registry.json', {})
+    now = dt.datetime.now(dt.timezone.utc)
+    stopped = []
+    for pid, meta in reg.items():
+        meta = meta or {}
+        if meta.get('hibernated_at') or not meta.get('container'):
+            continue
+        if not tool_db_path(pid).exists():
+            # not redeployed since DATA_DIR (database still inside the container): activity unknown
+            continue
+        last = tool_last_activity(pid, meta)
+        if last and (now - last).total_seconds() < idle_hours * 3600:
+            continue
+        # port and vhost stay reserved; nginx falls back to the wake proxy while stopped
+        if subprocess.run(['docker', 'stop', meta['container']], capture_output=True).returncode == 0:
+            update_registry(pid, hibernated_at=now_iso())
+            stopped.append(pid)
+    sleeping = sum(1 for m in read_json(PROJECTS_DIR / 'registry.json', {}).values() if (m or {}).get('hibernated_at'))
+    cold = cold_start_stats()
+    if stopped:
+        telegram_send(env, f"😴 Hibernated {len(stopped)} idle tools ({sleeping}/{len(reg)} asleep)\nCold start 7d: n={cold['count']} p50={cold['p50_ms']}ms p95={cold['p95_ms']}ms")
+    log_action('hibernation', 'run', {'idle_hours': idle_hours, 'stopped': stopped, 'hibernated_total': sleeping, 'cold_start_7d': cold})
+    return {'stopped': stopped, 'hibernated_total': sleeping, 'cold_start_7d': cold}
+
+
+# Warm pool: K generic tool containers running templates/micro-saas-template/pool_boot.js
+
+POOL_DIR = ROOT / 'live' / 'pool'
+POOL_FILE = POOL_DIR / 'pool.json'
+POOL_TEMPLATE = ROOT / 'templates' / 'micro-saas-template'
+POOL_IMAGE_INPUTS = ['Dockerfile', 'package.json', 'pool_boot.js']
+POOL_SLOT_GRACE = 60  # seconds a new slot may take to report standby before fill reaps it
+
+
+def allocate_port(pool: Dict[str, Any]) -> int:
+    used = {int(v['port']) for v in read_json(PROJECTS_DIR / 'registry.json', {}).values() if isinstance(v, dict) and v.get('port')}
+    used |= {int(v['port']) for v in pool.values()}
+    port = next((p for p in range(12000, 13000) if p not in used), None)
+    if port is None:
+        raise RuntimeError('No free ports in 12000-12999')
+    return port
+
+
+def pool_image() -> str:
+    """saas_pool:<hash of the image inputs>, so template changes produce a new image."""
+    h = hashlib.sha256()
+    for name in POOL_IMAGE_INPUTS:
+        f = POOL_TEMPLATE / name
+        h.update(name.encode() + b'\0' + (f.read_bytes() if f.exists() else b''))
+    return f'saas_pool:{h.hexdigest()[:12]}'
+
+
+def slot_ready(slot: Dict[str, Any]) -> bool:
+    try: return bool(requests.get(f"http://127.0.0.1:{slot['port']}/health", timeout=1).json().get('standby'))
+    except Exception: return False
+
+
+def warm_pool_reap(image: str) -> List[str]:
+    """Remove slots that died, never came up, or run an outdated image; they would hold capacity forever."""
+    now = dt.datetime.now(dt.timezone.utc)
+    reaped = []
+    for sid, slot in read_json(POOL_FILE, {}).items():
+        age = (now - (parse_ts(slot.get('created_at') or '') or now)).total_seconds()
+        if slot.get('image') == image and (age < POOL_SLOT_GRACE or slot_ready(slot)):
+            continue
+        # pop under the lock first: a slot already claimed (popped) by warm_pool_claim is left alone
+        if update_json_locked(POOL_FILE, lambda pool: pool.pop(sid, None)):
+            subprocess.run(['docker', 'rm', '-f', slot['container']], capture_output=True)
+            shutil.rmtree(slot['dir'], ignore_errors=True)
+            reaped.append(sid)
+    return reaped
+
+
+def warm_pool_fill(env: Dict[str, str]) -> Dict[str, Any]:
+    size = int(env.get('WARM_POOL_SIZE') or 0)
+    if size <= 0:
+        return {'size': 0, 'started': []}
+    image = pool_image()
+    if subprocess.run(['docker', 'image', 'inspect', image], capture_output=True).returncode != 0:
+        subprocess.run(['docker', 'build', '-t', image, str(POOL_TEMPLATE)], check=True)
+    reaped = warm_pool_reap(image)
+    started = []
+    while True:
+        sid = f'slot-{int(dt.datetime.now().timestamp() * 1000)}-{os.getpid()}'
+
+        def reserve(pool):
+            # size is checked under the lock: concurrent background refills cannot overshoot
+            if len(pool) >= size:
+                return None
+            pool[sid] = {'port': allocate_port(pool), 'container': f'saas_pool_{sid}', 'dir': str(POOL_DIR / sid), 'image': image, 'created_at': now_iso()}
+            return pool[sid]
+        slot = update_json_locked(POOL_FILE, reserve)
+        if not slot:
+            break
+        Path(slot['dir']).mkdir(parents=True, exist_ok=True)
+        r = subprocess.run([
+            'docker', 'run', '-d', '--name', slot['container'], '--restart', 'unless-stopped',
+            '-e', 'PORT=3000', '-e', 'DATA_DIR=/app/tool/data', '-v', f"{slot['dir']}:/app/tool",
+            '-p', f"127.0.0.1:{slot['port']}:3000", image, 'node', 'pool_boot.js',
+        ], capture_output=True)
+        if r.returncode != 0:
+            update_json_locked(POOL_FILE, lambda pool: pool.pop(sid, None))
+            log_action('warm_pool', 'start_failed', {'slot': sid, 'stderr': r.stderr.decode()[-500:]})
+            break
+        started.append(sid)
+    log_action('warm_pool', 'fill', {'size': size, 'image': image, 'started': started, 'reaped': reaped})
+    return {'size': size, 'image': image, 'started': started, 'reaped': reaped, 'slots': read_json(POOL_FILE, {})}
+
+
+def warm_pool_claim(project_id: str) -> bool:
+    """Deploy a rendered project into a ready standby container instead of building an image."""
+    image = pool_image()
+    for sid, slot in sorted(read_json(POOL_FILE, {}).items()):
+        if slot.get('image') == image and slot_ready(slot) and update_json_locked(POOL_FILE, lambda pool: pool.pop(sid, None)):
+            break
+    else:
+        return False
+    update_registry(project_id, port=slot['port'])
+    r = subprocess.run([str(ROOT / 'scripts' / 'deploy_project.sh'), project_id], env={**os.environ, 'WARM_SLOT_DIR': slot['dir'], 'WARM_CONTAINER': slot['container']})
+    log_action('warm_pool', 'claim', {'project_id': project_id, 'slot': sid, 'port': slot['port'], 'ok': r.returncode == 0})
+    if r.returncode != 0:
+        # the slot is out of pool.json by now: tear it down so the normal deploy gets a free port
+        subprocess.run(['docker', 'rm', '-f', slot['container'], f'saas_{project_id}'], capture_output=True)
+        update_registry(project_id, port=None)
+        data = PROJECTS_DIR / project_id / 'data'
+        if data.is_symlink():
+            data.unlink()
+        shutil.rmtree(slot['dir'], ignore_errors=True)
+    return r.returncode == 0
+
+
+def warm_pool_refill_async():
+    subprocess.Popen([sys.executable, str(Path(__file__).resolve()), 'warm-pool', 'fill'], start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
 def main():
@@ -465,16 +1195,30 @@ def main():
     sub = parser.add_subparsers(dest='cmd', required=True)
     sub.add_parser('niche-research')
     sub.add_parser('product-builder')
-    m = sub.add_parser('marketing'); m.add_argument('--project-id', required=True)
+    m = sub.add_parser('marketing'); g = m.add_mutually_exclusive_group(required=True)
+    g.add_argument('--project-id'); g.add_argument('--all', action='store_true'); g.add_argument('--project-ids', nargs='+')
+    m.add_argument('--force', action='store_true')
     sub.add_parser('analytics'); sub.add_parser('optimization'); sub.add_parser('revenue')
+    sub.add_parser('fit-scoring'); sub.add_parser('hibernate')
+    tr = sub.add_parser('trend'); tr.add_argument('--project-id', required=True); tr.add_argument('--days', type=int, default=365)
+    wp = sub.add_parser('warm-pool'); wp.add_argument('action', choices=['fill', 'status'])
+    rg = sub.add_parser('regenerate'); g = rg.add_mutually_exclusive_group(required=True)
+    g.add_argument('--all', action='store_true'); g.add_argument('--project-ids', nargs='+')
+    rg.add_argument('--no-deploy', action='store_true'); rg.add_argument('--dry-run', action='store_true')
     args = parser.parse_args(); env = load_env()
 
     if args.cmd == 'niche-research': niche_research(env)
     elif args.cmd == 'product-builder': product_builder(env)
-    elif args.cmd == 'marketing': marketing_assets(env, args.project_id)
+    elif args.cmd == 'marketing' and args.project_id: marketing_assets(env, args.project_id)
+    elif args.cmd == 'marketing': print(json.dumps(marketing_batch(env, args.project_ids, force=args.force), indent=2))
     elif args.cmd == 'analytics': analytics(env)
     elif args.cmd == 'optimization': optimization(env)
     elif args.cmd == 'revenue': revenue(env)
+    elif args.cmd == 'regenerate': print(json.dumps(regenerate(env, args.project_ids, deploy=not args.no_deploy, dry_run=args.dry_run), indent=2))
+    elif args.cmd == 'warm-pool': print(json.dumps(warm_pool_fill(env) if args.action == 'fill' else read_json(POOL_FILE, {}), indent=2))
+    elif args.cmd == 'hibernate': print(json.dumps(hibernation(env), indent=2))
+    elif args.cmd == 'trend': print(json.dumps(warehouse_trend(warehouse_connect(), args.project_id, args.days), indent=2))
+    elif args.cmd == 'fit-scoring': print(json.dumps(fit_scoring_model() or HEURISTIC_MODEL, indent=2))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Content-addressed project scaffolding.
+
+Template files are stored once under live/objects/<sha256> and hardlinked into each
+project, so a new project costs directory entries rather than template bytes. Files a
+project rewrites (PER_PROJECT) are real copies, and the agents replace files atomically,
+so a write never reaches a shared object. `gc` drops objects no project links any more.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Dict
+
+ROOT = Path('/srv/ai-software-factory')
+STORE = ROOT / 'live' / 'objects'
+PER_PROJECT = {'server.js', 'public/index.html', '.env'}
+
+
+def file_sha(p: Path) -> str:
+    h = hashlib.sha256()
+    with p.open('rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def template_manifest(template: Path) -> Dict[str, str]:
+    """relpath -> sha256, rehashing only files whose size/mtime changed since the last run."""
+    cache_p = STORE / 'manifests' / f'{template.name}.json'
+    try: cache = json.loads(cache_p.read_text())
+    except Exception: cache = {}
+    out, fresh = {}, {}
+    for f in sorted(template.rglob('*')):
+        if not f.is_file():
+            continue
+        rel, st = f.relative_to(template).as_posix(), f.stat()
+        key = f'{st.st_size}:{st.st_mtime_ns}'
+        c = cache.get(rel)
+        sha = c['sha'] if c and c['key'] == key and (STORE / c['sha'][:2] / c['sha']).exists() else None
+        if not sha:
+            sha = file_sha(f)
+            obj = STORE / sha[:2] / sha
+            if not obj.exists():
+                obj.parent.mkdir(parents=True, exist_ok=True)
+                tmp = obj.with_suffix('.tmp')
+                shutil.copy2(f, tmp)
+                os.replace(tmp, obj)
+        out[rel] = sha
+        fresh[rel] = {'key': key, 'sha': sha}
+    cache_p.parent.mkdir(parents=True, exist_ok=True)
+    cache_p.write_text(json.dumps(fresh))
+    return out
+
+
+def link_or_copy(src: Path, dst: Path):
+    try:
+        os.link(src, dst)
+    except OSError:
+        # cross-device store: fall back to a reflink (or plain copy where unsupported)
+        subprocess.run(['cp', '--reflink=auto', str(src), str(dst)], check=True)
+
+
+def materialize(template: Path, dest: Path) -> Dict[str, int]:
+    linked = copied = 0
+    for rel, sha in template_manifest(template).items():
+        dst = dest / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if dst.exists() or dst.is_symlink():
+            dst.unlink()
+        obj = STORE / sha[:2] / sha
+        if rel in PER_PROJECT:
+            shutil.copy2(obj, dst); copied += 1
+        else:
+            link_or_copy(obj, dst); linked += 1
+    return {'linked': linked, 'copied': copied}
+
+
+def gc(dry_run: bool = False) -> Dict[str, int]:
+    keep = set()
+    for m in (STORE / 'manifests').glob('*.json'):
+        try: keep |= {v['sha'] for v in json.loads(m.read_text()).values()}
+        except Exception: pass
+    removed = freed = 0
+    for obj in STORE.glob('??/*'):
+        st = obj.stat()
+        # nlink > 1: still hardlinked into a project; current template objects are kept too
+        if st.st_nlink > 1 or obj.name in keep:
+            continue
+        removed += 1; freed += st.st_size
+        if not dry_run:
+            obj.unlink()
+    return {'removed': removed, 'freed_bytes': freed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    m = sub.add_parser('materialize'); m.add_argument('template'); m.add_argument('dest')
+    g = sub.add_parser('gc'); g.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    if args.cmd == 'materialize':
+        print(json.dumps(materialize(Path(args.template), Path(args.dest))))
+    elif args.cmd == 'gc':
+        print(json.dumps(gc(args.dry_run)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Cold-start proxy for hibernated tools.
+
+nginx only sends a tool's request here when it could not reach the upstream
+container (error_page 502 -> @wake in the vhost written by deploy_project.sh). We
+start the container, hold the request until /health passes, forward it, and record
+the cold-start latency in reports/cold-starts.jsonl.
+
+nginx also answers 502 when a running tool resets or closes the connection mid-request
+(e.g. Node crashing), and then the request did reach the tool. So we only wake and
+forward for tools the registry marks hibernated_at, and only once the container came up
+after the request arrived. Every other 502 is passed through, so a non-idempotent call
+(/api/use, grants) is never replayed.
+"""
+import argparse
+import json
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+import requests
+
+from revenue_system import COLD_START_LOG, PROJECTS_DIR, ensure_dirs, now_iso, read_json, update_registry
+
+WAKE_TIMEOUT = 45
+HOP_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'upgrade', 'proxy-connection', 'te', 'trailer', 'host', 'content-length', 'x-tool-id'}
+
+_locks: Dict[str, threading.Lock] = {}
+_woken: Dict[str, float] = {}  # project_id -> monotonic time this proxy last brought it up
+_locks_guard = threading.Lock()
+
+
+def healthy(port: int) -> bool:
+    try:
+        return requests.get(f'http://127.0.0.1:{port}/health', timeout=1).ok
+    except Exception:
+        return False
+
+
+def wake(project_id: str, meta: Dict[str, Any]) -> bool:
+    port = int(meta['port'])
+    with _locks_guard:
+        lock = _locks.setdefault(project_id, threading.Lock())
+    # concurrent first requests wait on the same wake-up instead of racing docker start
+    with lock:
+        if healthy(port):
+            return True
+        t0 = time.monotonic()
+        subprocess.run(['docker', 'start', meta.get('container') or f'saas_{project_id}'], capture_output=True)
+        ok = False
+        while time.monotonic() - t0 < WAKE_TIMEOUT:
+            if healthy(port):
+                ok = True
+                break
+            time.sleep(0.1)
+        ms = int((time.monotonic() - t0) * 1000)
+        ensure_dirs()
+        with COLD_START_LOG.open('a') as f:
+            f.write(json.dumps({'ts': now_iso(), 'project_id': project_id, 'ms': ms, 'ok': ok}) + '\n')
+        if ok:
+            _woken[project_id] = time.monotonic()
+            update_registry(project_id, hibernated_at=None, woken_at=now_iso())
+        return ok
+
+
+class WakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, code: int, body: bytes, headers: Dict[str, str] = None):
+        self.send_response(code)
+        for k, v in (headers or {'Content-Type': 'text/plain; charset=utf-8'}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _handle(self):
+        arrived = time.monotonic()
+        pid = self.headers.get('X-Tool-Id', '')
+        meta = read_json(PROJECTS_DIR / 'registry.json', {}).get(pid) or {}
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not meta.get('port'):
+            return self._reply(404, b'unknown tool')
+        if not meta.get('hibernated_at'):
+            # not stopped by hibernation(): the tool itself failed, maybe after handling the request
+            return self._reply(502, b'upstream error')
+        if not wake(pid, meta):
+            return self._reply(503, b'tool is starting, retry shortly', {'Content-Type': 'text/plain; charset=utf-8', 'Retry-After': '5'})
+        if _woken.get(pid, 0) < arrived:
+            # the tool was already up: the 502 came from it, and the request may have been processed
+            return self._reply(502, b'upstream error')
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in HOP_HEADERS}
+        headers['Accept-Encoding'] = 'identity'
+        try:
+            r = requests.request(self.command, f"http://127.0.0.1:{meta['port']}{self.path}", headers=headers, data=body or None, timeout=120, allow_redirects=False)
+        except Exception:
+            return self._reply(502, b'upstream error')
+        self._reply(r.status_code, r.content, {k: v for k, v in r.headers.items() if k.lower() not in HOP_HEADERS | {'content-encoding'}})
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _handle
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=11999)
+    args = parser.parse_args()
+    ThreadingHTTPServer(('127.0.0.1', args.port), WakeHandler).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,11 @@ reg_path='/srv/ai-software-factory/projects/registry.json'
 with open(reg_path,'r') as f:
     reg=json.load(f) if f.read().strip() else {}
 used={int(v.get('port')) for v in reg.values() if isinstance(v,dict) and v.get('port')}
+try:
+    with open('/srv/ai-software-factory/live/pool/pool.json','r') as f:
+        used|={int(v['port']) for v in json.load(f).values()}
+except Exception:
+    pass
 for p in range(12000,13000):
     if p not in used:
         print(p)
@@ -8,10 +8,12 @@ fi
 ROOT=/srv/ai-software-factory
 PROJECT_DIR="$ROOT/projects/$PROJECT_ID"
 REGISTRY="$ROOT/projects/registry.json"
+POOL_FILE="$ROOT/live/pool/pool.json"
 DOMAIN="${PROJECT_ID}.petsy.company"
 NGINX_AVAIL="/etc/nginx/sites-available/${DOMAIN}.conf"
 NGINX_ENABLED="/etc/nginx/sites-enabled/${DOMAIN}.conf"
 CONTAINER="saas_${PROJECT_ID}"
+WAKE_PROXY_PORT="${WAKE_PROXY_PORT:-11999}"
 
 if [ ! -f "$PROJECT_DIR/package.json" ]; then
   echo "Project missing package.json: $PROJECT_DIR" >&2
@@ -21,7 +23,11 @@ fi
 mkdir -p "$(dirname "$REGISTRY")"
 [ -f "$REGISTRY" ] || echo '{}' > "$REGISTRY"
 
-PORT=$(python3 - <<PY
+# registry.json is shared with the agents and the wake proxy (update_json_locked in
+# revenue_system.py): every read-modify-write holds the flock on registry.json.lock and
+# replaces the file atomically, so lock-free readers never see it half-written
+REGISTRY_LOCK="$REGISTRY.lock"
+PORT=$(flock "$REGISTRY_LOCK" python3 - <<PY
 import json
 reg_path='$REGISTRY'
 pid='$PROJECT_ID'
@@ -32,6 +38,11 @@ if pid in reg and isinstance(reg[pid],dict) and reg[pid].get('port'):
     print(reg[pid]['port'])
     raise SystemExit(0)
 used={int(v.get('port')) for v in reg.values() if isinstance(v,dict) and v.get('port')}
+try:
+    with open('$POOL_FILE','r') as f:
+        used|={int(v['port']) for v in json.load(f).values()}
+except Exception:
+    pass
 for p in range(12000,13000):
     if p not in used:
         print(p)
@@ -47,20 +58,68 @@ PROJECT_ENV="$PROJECT_DIR/.env"
 if [ -f "$GLOBAL_ENV" ]; then
   awk -F= '/^(ADMIN_TOKEN|OPENROUTER_API_KEY|OPENROUTER_MODEL|PAYPAL_MODE|PAYPAL_CLIENT_ID)=/{print}' "$GLOBAL_ENV" >> "$PROJECT_ENV" || true
 fi
-sed -i "/^PORT=/d" "$PROJECT_ENV"
+sed -i "/^PORT=/d;/^DATA_DIR=/d" "$PROJECT_ENV"
 echo "PORT=3000" >> "$PROJECT_ENV"
+# data.sqlite lives on the host so analytics/revenue can read it directly
+echo "DATA_DIR=/app/data" >> "$PROJECT_ENV"
 
-# build + run
 cd "$PROJECT_DIR"
+if [ ! -f "$PROJECT_DIR/data/data.sqlite" ] && docker inspect "$CONTAINER" >/dev/null 2>&1; then
+  # tools deployed before DATA_DIR keep data.sqlite inside the container: carry it over to the
+  # bind mount before the container goes, or the new one starts with no users/credits/purchases
+  mkdir -p "$PROJECT_DIR/data"
+  docker exec "$CONTAINER" node -e "const D=require('better-sqlite3');const d=new D('/app/data.sqlite');d.pragma('wal_checkpoint(TRUNCATE)');d.close();" >/dev/null 2>&1 || true
+  docker stop -t 20 "$CONTAINER" >/dev/null 2>&1 || true
+  if ! docker cp "$CONTAINER:/app/data.sqlite" "$PROJECT_DIR/data/data.sqlite"; then
+    echo "Could not copy /app/data.sqlite out of $CONTAINER; not redeploying" >&2
+    docker start "$CONTAINER" >/dev/null 2>&1 || true
+    exit 4
+  fi
+  for f in data.sqlite-wal data.sqlite-shm; do
+    docker cp "$CONTAINER:/app/$f" "$PROJECT_DIR/data/$f" >/dev/null 2>&1 || true
+  done
+fi
 docker rm -f "$CONTAINER" >/dev/null 2>&1 || true
-docker build -t "$CONTAINER:latest" .
-docker run -d --name "$CONTAINER" --restart unless-stopped --env-file "$PROJECT_ENV" -p "127.0.0.1:${PORT}:3000" "$CONTAINER:latest"
+if [ -n "${WARM_SLOT_DIR:-}" ]; then
+  # warm pool: hand the rendered tool to an already-running generic container (pool_boot.js)
+  cp -R server.js public "$PROJECT_ENV" "$WARM_SLOT_DIR"/
+  [ -f tool_logic.js ] && cp tool_logic.js "$WARM_SLOT_DIR"/
+  mkdir -p "$WARM_SLOT_DIR/data"
+  rmdir "$PROJECT_DIR/data" 2>/dev/null || true
+  ln -sfn "$WARM_SLOT_DIR/data" "$PROJECT_DIR/data"
+  echo "{\"project_id\":\"$PROJECT_ID\"}" > "$WARM_SLOT_DIR/claim.json"
+  docker rename "$WARM_CONTAINER" "$CONTAINER"
+  BOOTED=0
+  for _ in $(seq 1 150); do
+    if curl -fs "http://127.0.0.1:${PORT}/health" | grep -q "\"service\":\"${PROJECT_ID}\""; then BOOTED=1; break; fi
+    sleep 0.1
+  done
+  if [ "$BOOTED" != 1 ]; then
+    # no vhost/registry entry for a tool that never came up; warm_pool_claim cleans up the slot
+    echo "Warm slot did not boot $PROJECT_ID on port $PORT" >&2
+    exit 3
+  fi
+else
+  # build + run
+  mkdir -p "$PROJECT_DIR/data"
+  docker build -t "$CONTAINER:latest" .
+  docker run -d --name "$CONTAINER" --restart unless-stopped --env-file "$PROJECT_ENV" -v "$PROJECT_DIR/data:/app/data" -p "127.0.0.1:${PORT}:3000" "$CONTAINER:latest"
+fi
 
 # nginx
 cat > "$NGINX_AVAIL" <<CONF
 server {
     listen 80;
     server_name ${DOMAIN};
+    gzip on;
+
+    # content-hashed, precompressed assets straight from disk
+    location /assets/ {
+        root ${PROJECT_DIR}/public;
+        gzip_static on;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+        try_files \$uri =404;
+    }
 
     location / {
         proxy_pass http://127.0.0.1:${PORT};
@@ -69,6 +128,20 @@ server {
         proxy_set_header X-Real-IP \$remote_addr;
         proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
         proxy_set_header X-Forwarded-Proto \$scheme;
+        # hibernated container (connection refused): hand the request to the wake proxy
+        # (agents/wake_proxy.py). 504s are not intercepted: a slow tool must not be replayed.
+        error_page 502 = @wake;
+    }
+
+    location @wake {
+        proxy_pass http://127.0.0.1:${WAKE_PROXY_PORT};
+        proxy_http_version 1.1;
+        proxy_read_timeout 120s;
+        proxy_set_header X-Tool-Id ${PROJECT_ID};
+        proxy_set_header Host \$host;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto \$scheme;
     }
 }
 CONF
@@ -82,8 +155,8 @@ if command -v certbot >/dev/null 2>&1; then
 fi
 
 # update registry
-python3 - <<PY
-import json, datetime
+flock "$REGISTRY_LOCK" python3 - <<PY
+import json, datetime, os
 reg_path='$REGISTRY'
 pid='$PROJECT_ID'
 port=int('$PORT')
@@ -93,15 +166,20 @@ container='$CONTAINER'
 with open(reg_path,'r') as f:
     txt=f.read().strip()
 reg=json.loads(txt) if txt else {}
-reg[pid]={
+meta=reg.setdefault(pid,{})
+meta.update({
   'port':port,
   'domain':domain,
   'url':url,
   'container':container,
   'updated_at':datetime.datetime.utcnow().isoformat()+'Z'
-}
-with open(reg_path,'w') as f:
+})
+# a fresh deploy leaves the container running
+meta.pop('hibernated_at',None)
+tmp=f'{reg_path}.{os.getpid()}.tmp'
+with open(tmp,'w') as f:
     json.dump(reg,f,indent=2)
+os.replace(tmp,reg_path)
 PY
 
 echo "Deployed: https://${DOMAIN} -> 127.0.0.1:${PORT}"
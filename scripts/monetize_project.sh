@@ -10,7 +10,8 @@ PROJECT_DIR="$ROOT/projects/$PROJECT_ID"
 TEMPLATE="$ROOT/templates/micro-saas-template"
 
 mkdir -p "$PROJECT_DIR"
-cp -R "$TEMPLATE"/. "$PROJECT_DIR"/
+# hardlink template files from the content-addressed store; only per-project files are copied
+python3 "$ROOT/agents/scaffold.py" materialize "$TEMPLATE" "$PROJECT_DIR"
 
 # inject placeholder helper for tool logic (called by /api/use in server.js future extension)
 cat > "$PROJECT_DIR/tool_logic.js" <<'JS'
@@ -1,4 +1,8 @@
 #!/usr/bin/env python3
+import asyncio
+import csv
+import hashlib
+import io
 import json
 import os
 import re
@@ -15,6 +19,7 @@ from telegram.ext import Application, CallbackQueryHandler, CommandHandler, Cont
 ROOT = Path('/srv/ai-software-factory')
 PROJECTS_ROOT = ROOT / 'projects'
 STATE_FILE = ROOT / 'telegram_bot' / 'state.json'
+GRANT_BULK_CHUNK = 1000
 
 
 def load_env(path: Path) -> Dict[str, str]:
@@ -58,15 +63,15 @@ def detect_stack(spec: str) -> str:
 
 def create_project(project_id: str, spec: str = ''):
     p = PROJECTS_ROOT / project_id
-    (p / 'tasks').mkdir(parents=True, exist_ok=True)
-    (p / 'state').mkdir(parents=True, exist_ok=True)
-    (p / 'repo').mkdir(parents=True, exist_ok=True)
-    (p / 'logs').mkdir(parents=True, exist_ok=True)
-    try:
-        for x in [p, p / 'tasks', p / 'state', p / 'repo', p / 'logs']:
+    # only new dirs need creating + chmod; create_project runs again when the spec arrives
+    for x in [p, p / 'tasks', p / 'state', p / 'repo', p / 'logs']:
+        if x.is_dir():
+            continue
+        x.mkdir(parents=True, exist_ok=True)
+        try:
             os.chmod(x, 0o777)
-    except Exception:
-        pass
+        except Exception:
+            pass
     if spec:
         (p / 'project_spec.md').write_text(spec)
     stack = detect_stack(spec) if spec else 'nextjs'
@@ -216,7 +221,9 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "2) 📝 إضافة مواصفات\n"
         "3) 🚀 تشغيل مشروع\n"
         "4) 📊 حالة المشروع\n"
-        "5) /grant <user_id> <credits> <note>",
+        "5) /grant <user_id> <credits> <note>\n"
+        "6) /grantbulk <credits> <note> ثم سطر لكل مستخدم: user_id[,credits[,note]] (أو ملف CSV مع الأمر كتعليق)\n"
+        "   إعادة الإرسال بنفس الملاحظة آمنة (لا يتكرر الشحن)، وملاحظة جديدة = دفعة جديدة",
         reply_markup=MAIN_KB,
     )
 
@@ -263,6 +270,90 @@ async def grant_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f'❌ Request failed: {e}')
 
 
+def parse_grant_rows(text: str, default_credits: int, default_note: str) -> Tuple[List[Dict[str, Any]], List[str]]:
+    rows, bad, seen = [], [], set()
+    for rec in csv.reader(io.StringIO(text)):
+        rec = [x.strip() for x in rec]
+        if not rec or not rec[0] or rec[0].lower() == 'user_id':
+            continue
+        try:
+            credits = int(rec[1]) if len(rec) > 1 and rec[1] else default_credits
+        except ValueError:
+            bad.append(rec[0])
+            continue
+        if rec[0] in seen:
+            continue
+        seen.add(rec[0])
+        rows.append({'user_id': rec[0], 'credits': credits, 'note': (rec[2] if len(rec) > 2 and rec[2] else default_note)})
+    return rows, bad
+
+
+async def grantbulk_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    env = context.bot_data['env']
+    admin_token = (env.get('ADMIN_TOKEN') or '').strip()
+    base_url = (env.get('LOCAL_UNLOCK_BASE_URL') or 'https://demo-tool.petsy.company').rstrip('/')
+
+    if not admin_token:
+        await update.message.reply_text('❌ ADMIN_TOKEN غير مضبوط في .env')
+        return
+
+    msg = update.message
+    head, _, body = (msg.text or msg.caption or '').partition('\n')
+    parts = head.split(maxsplit=2)
+    if len(parts) < 3 or not parts[2].strip():
+        # the note names the batch (it is part of every idempotency key), so it is required
+        await msg.reply_text('Usage: /grantbulk <credits> <note>\nuser_id[,credits[,note]]\n... (one user per line, or attach a CSV)')
+        return
+    try:
+        default_credits = int(parts[1])
+    except ValueError:
+        await msg.reply_text('❌ credits لازم يكون رقم صحيح')
+        return
+    default_note = parts[2].strip()
+    if msg.document:
+        f = await msg.document.get_file()
+        body = bytes(await f.download_as_bytearray()).decode('utf-8-sig', errors='replace')
+
+    rows, bad = parse_grant_rows(body, default_credits, default_note)
+    if not rows:
+        await msg.reply_text('Usage: /grantbulk <credits> <note>\nuser_id[,credits[,note]]\n... (one user per line, or attach a CSV)\nThe same user+credits+note is granted once; use a new note to grant again.')
+        return
+
+    # keys come from the grant itself (user, credits, note), not the message: re-sending the same
+    # /grantbulk after a failed chunk skips users already credited. A new note starts a new batch.
+    for g in rows:
+        g['idempotency_key'] = 'tg-' + hashlib.sha256(f"{g['user_id']}\n{g['credits']}\n{g['note']}".encode()).hexdigest()[:32]
+
+    total = {'granted': 0, 'duplicates': 0, 'invalid': len(bad)}
+    progress = await msg.reply_text(f'⏳ Bulk grant: 0/{len(rows)}')
+    for i in range(0, len(rows), GRANT_BULK_CHUNK):
+        chunk = rows[i:i + GRANT_BULK_CHUNK]
+        try:
+            r = await asyncio.to_thread(
+                requests.post,
+                f'{base_url}/api/unlock/local/batch',
+                headers={'Authorization': f'Bearer {admin_token}', 'Content-Type': 'application/json'},
+                json={'grants': chunk},
+                timeout=60,
+            )
+            data = r.json() if 'application/json' in (r.headers.get('content-type') or '') else {'raw': r.text[:400]}
+        except Exception as e:
+            await progress.edit_text(f'❌ Request failed after {i}/{len(rows)}: {e}')
+            return
+        if r.status_code >= 400:
+            await progress.edit_text(f"❌ Bulk grant failed after {i}/{len(rows)} ({r.status_code})\n{json.dumps(data, ensure_ascii=False)[:400]}")
+            return
+        for k in total:
+            total[k] += int(data.get(k) or 0)
+        await progress.edit_text(f'⏳ Bulk grant: {i + len(chunk)}/{len(rows)}')
+
+    await progress.edit_text(
+        f"✅ Bulk grant done\ngranted: {total['granted']}\nduplicates: {total['duplicates']}\ninvalid: {total['invalid']}"
+        + (f"\nskipped: {', '.join(bad[:20])}" if bad else '')
+        + f"\nendpoint: {base_url}/api/unlock/local/batch"
+    )
+
+
 async def on_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
@@ -446,6 +537,8 @@ def main():
     app.add_handler(CommandHandler('start', start))
     app.add_handler(CommandHandler('help', help_cmd))
     app.add_handler(CommandHandler('grant', grant_cmd))
+    app.add_handler(CommandHandler('grantbulk', grantbulk_cmd))
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r'^/grantbulk'), grantbulk_cmd))
     app.add_handler(CallbackQueryHandler(on_callback))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, on_text))
 
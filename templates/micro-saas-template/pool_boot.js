@@ -0,0 +1,36 @@
+// Warm-pool bootstrap (see warm_pool_* in agents/revenue_system.py).
+// The container starts before any tool exists: node_modules are loaded and the port is bound.
+// deploy_project.sh copies a rendered tool into /app/tool and writes claim.json; we then boot
+// its server.js in this same process, so going live skips image build, container start and npm.
+const fs = require('fs');
+const http = require('http');
+const path = require('path');
+['express', 'cors', 'dotenv', 'better-sqlite3'].forEach((m) => require(m));
+
+const TOOL_DIR = process.env.POOL_TOOL_DIR || '/app/tool';
+const CLAIM = path.join(TOOL_DIR, 'claim.json');
+const PORT = Number(process.env.PORT || 3000);
+
+const standby = http.createServer((req, res) => {
+  const ok = req.url === '/health';
+  res.writeHead(ok ? 200 : 503, { 'content-type': 'application/json' });
+  res.end(JSON.stringify({ ok, standby: true }));
+});
+
+function start() {
+  process.chdir(TOOL_DIR);
+  require(path.join(TOOL_DIR, 'server.js'));
+}
+
+function boot() {
+  if (!fs.existsSync(CLAIM)) return false;
+  if (!standby.listening) { start(); return true; }
+  standby.close(start);
+  standby.closeAllConnections();
+  return true;
+}
+
+if (!boot()) {
+  standby.listen(PORT, () => console.log('standby', PORT));
+  const t = setInterval(() => { if (boot()) clearInterval(t); }, 100);
+}
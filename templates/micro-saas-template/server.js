@@ -18,7 +18,7 @@ const PAYPAL_BASE = PAYPAL_MODE === 'live' ? 'https://api-m.paypal.com' : 'https
 app.use(cors());
 app.use(express.json({ limit: '1mb' }));
 
-const db = new Database(path.join(__dirname, 'data.sqlite'));
+const db = new Database(path.join(process.env.DATA_DIR || __dirname, 'data.sqlite'));
 db.pragma('journal_mode = WAL');
 db.exec(`
 CREATE TABLE IF NOT EXISTS users (